@@ -1,9 +1,10 @@
 import streamlit as st
-import json
 import os
 from enum import Enum
 from datetime import datetime
 
+import pyPLM
+
 # === Basic Configuration ===
 st.set_page_config(
     page_title="Change Management System",
@@ -25,34 +26,26 @@ class Status(Enum):
     COMPLETED = "Completed"
 
 # === State Management ===
-def save_state():
-    state_data = {
-        "changes": st.session_state.changes,
-        "current_time": CURRENT_TIME,
-        "current_user": CURRENT_USER
-    }
+# Changes live in pyPLM's database (change_records), one row per change; every
+# render reads them fresh, so concurrent sessions see each other's updates.
+def init_store():
     try:
-        with open(DATA_FILE, "w") as f:
-            json.dump(state_data, f, indent=2)
+        pyPLM.create_database()
+        # One-time move of the old JSON store into the database
+        # import_change_data returns 0 if a concurrent session already took the file
+        if os.path.exists(DATA_FILE):
+            count = pyPLM.import_change_data(DATA_FILE)
+            if count:
+                st.info(f"Imported {count} changes from {DATA_FILE}")
     except Exception as e:
-        st.error(f"Failed to save state: {e}")
-
-def load_state():
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r") as f:
-                data = json.load(f)
-                return data.get("changes", {})
-        except Exception as e:
-            st.error(f"Failed to load state: {e}")
-    return {}
+        st.error(f"Failed to open change store: {e}")
 
 # === Session State Initialization ===
 if 'initialized' not in st.session_state:
     st.session_state.initialized = True
     st.session_state.authenticated = False
     st.session_state.role = None
-    st.session_state.changes = load_state()
+    init_store()
 
 # === Role Selection Page ===
 def show_role_selection():
@@ -106,30 +99,28 @@ def create_change_request():
         submitted = st.form_submit_button("Create Issue")
         
         if submitted and title:
-            change_id = f"CHG-{len(st.session_state.changes) + 1}"
-            st.session_state.changes[change_id] = {
-                "id": change_id,
-                "title": title,
-                "description": description,
-                "impact": impact,
-                "status": Status.OPEN.value,
-                "created_by": CURRENT_USER,
-                "created_at": CURRENT_TIME,
-                "phase": "Issue",
-                "actions": []
-            }
-            save_state()
-            st.success(f"Issue {change_id} created successfully!")
+            change = pyPLM.create_change_record(
+                title,
+                description,
+                impact,
+                created_by=CURRENT_USER,
+                created_at=CURRENT_TIME,
+                status=Status.OPEN.value,
+                phase="Issue"
+            )
+            st.success(f"Issue {change['id']} created successfully!")
 
 def show_change_list(role):
     st.subheader("Change Requests")
     
-    if not st.session_state.changes:
+    changes = pyPLM.list_change_records()
+    if not changes:
         st.info("No changes found in the system.")
         return
     
     # Filter changes based on role and status
-    for change_id, change in st.session_state.changes.items():
+    for change in changes:
+        change_id = change['id']
         with st.expander(f"{change_id}: {change['title']} ({change['status']})"):
             col1, col2 = st.columns([3, 1])
             
@@ -144,23 +135,30 @@ def show_change_list(role):
                 if role == "Change Coordinator/Manager":
                     if change['phase'] == "Issue" and change['status'] == Status.OPEN.value:
                         if st.button(f"Analyze Impact {change_id}", key=f"analyze_{change_id}"):
-                            change['phase'] = "CR"
-                            change['status'] = Status.PENDING.value
-                            save_state()
-                            st.success(f"Change {change_id} moved to CR phase")
+                            if pyPLM.update_change_record(change_id, expected_phase="Issue",
+                                                          expected_status=Status.OPEN.value,
+                                                          phase="CR", status=Status.PENDING.value):
+                                st.success(f"Change {change_id} moved to CR phase")
+                            else:
+                                st.warning(f"Change {change_id} was already updated in another session")
                     
                     elif change['phase'] == "CR" and change['status'] == Status.PENDING.value:
                         if st.button(f"Create CO {change_id}", key=f"create_co_{change_id}"):
-                            change['phase'] = "CO"
-                            change['status'] = Status.OPEN.value
-                            save_state()
-                            st.success(f"Change Order created for {change_id}")
+                            if pyPLM.update_change_record(change_id, expected_phase="CR",
+                                                          expected_status=Status.PENDING.value,
+                                                          phase="CO", status=Status.OPEN.value):
+                                st.success(f"Change Order created for {change_id}")
+                            else:
+                                st.warning(f"Change {change_id} was already updated in another session")
                 
-                elif role == "Change Contributors" and change['phase'] == "CO":
+                elif role == "Change Contributors" and change['phase'] == "CO" and change['status'] == Status.OPEN.value:
                     if st.button(f"Implement {change_id}", key=f"implement_{change_id}"):
-                        change['status'] = Status.COMPLETED.value
-                        save_state()
-                        st.success(f"Change {change_id} marked as completed")
+                        if pyPLM.update_change_record(change_id, expected_phase="CO",
+                                                      expected_status=Status.OPEN.value,
+                                                      status=Status.COMPLETED.value):
+                            st.success(f"Change {change_id} marked as completed")
+                        else:
+                            st.warning(f"Change {change_id} was already updated in another session")
             
             if change['actions']:
                 st.write("**Actions:**")
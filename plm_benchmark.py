@@ -0,0 +1,390 @@
+# plm_benchmark.py
+# Benchmarks for the pyPLM data layer.
+# Usage: python plm_benchmark.py [--suites data,pool,import,as-of,memory,versions] [--output results.json]
+#        python plm_benchmark.py --suites data --depth 5 --fan-out 4 --shared 0.3 --output baseline.json
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pyPLM
+
+# === Helpers ===
+def timed(fn, ops):
+    start = time.perf_counter()
+    fn(ops)
+    elapsed = time.perf_counter() - start
+    return {"ops": ops, "seconds": round(elapsed, 4), "ops_per_sec": round(ops / elapsed, 1) if elapsed else None}
+
+def latency_stats(samples):
+    # Throughput plus nearest-rank percentiles over per-operation latencies
+    ordered = sorted(samples)
+    total = sum(ordered)
+    def percentile(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 4)
+    return {"ops": len(ordered), "seconds": round(total, 4),
+            "ops_per_sec": round(len(ordered) / total, 1) if total else None,
+            "p50_ms": percentile(0.50), "p99_ms": percentile(0.99)}
+
+def sampled(fn, args):
+    # Calls fn(*a) for each a in args, timing each call on its own
+    samples = []
+    for a in args:
+        start = time.perf_counter()
+        fn(*a)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def fresh_database(directory, name):
+    path = os.path.join(directory, name)
+    pyPLM.use_database(path)
+    pyPLM.create_database()
+    return path
+
+# === Connection pool: before / after ===
+def legacy_connection(path):
+    # The pre-pool pattern: a fresh, untuned connection per call, never closed.
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def bench_legacy(path, ops):
+    def insert(ops):
+        for i in range(ops):
+            conn = legacy_connection(path)
+            conn.execute("INSERT INTO bom_links (parent_item, child_item, quantity) VALUES (?, ?, ?)",
+                         ("P0001", f"P{i:06d}", 1))
+            conn.commit()
+
+    def read(ops):
+        for i in range(ops):
+            conn = legacy_connection(path)
+            conn.execute("SELECT state FROM items WHERE item_number = ?", ("P0001",)).fetchone()
+    return {"insert": timed(insert, ops), "read": timed(read, ops)}
+
+def bench_pooled(ops):
+    def insert(ops):
+        for i in range(ops):
+            pyPLM.add_bom_link_to_db("P0001", f"P{i:06d}", 1)
+
+    def read(ops):
+        # Straight to the pooled connection so the item state cache does not mask it
+        for i in range(ops):
+            pyPLM.get_db_connection().execute("SELECT state FROM items WHERE item_number = ?", ("P0001",)).fetchone()
+    return {"insert": timed(insert, ops), "read": timed(read, ops)}
+
+def bench_connection_pool(directory, ops):
+    legacy_path = fresh_database(directory, "legacy.db")
+    pyPLM.close_db_connections()
+    # Legacy connections never switched to WAL
+    legacy_connection(legacy_path).execute("PRAGMA journal_mode=DELETE")
+    legacy = bench_legacy(legacy_path, ops)
+    fresh_database(directory, "pooled.db")
+    pooled = bench_pooled(ops)
+    pyPLM.close_db_connections()
+    return {"legacy": legacy, "pooled": pooled}
+
+# === Bulk import ===
+def synthetic_bom_rows(count, fan_out=10):
+    # A tree of source keys: row i links node i // fan_out to node i + 1
+    for i in range(count):
+        yield {"parent_item": f"SRC-{i // fan_out}", "child_item": f"SRC-{i + 1}", "quantity": 1 + i % 3}
+
+def bench_bulk_import(directory, ops):
+    fresh_database(directory, "row_by_row.db")
+    def row_by_row(ops):
+        for row in synthetic_bom_rows(ops):
+            pyPLM.add_bom_link_to_db(row["parent_item"], row["child_item"], row["quantity"])
+    per_row = timed(row_by_row, ops)
+    fresh_database(directory, "bulk.db")
+    bulk = timed(lambda ops: pyPLM.import_bom(synthetic_bom_rows(ops)), ops)
+    pyPLM.close_db_connections()
+    return {"per_row": {"import": per_row}, "bulk": {"import": bulk}}
+
+# === As-of queries over revision history ===
+def bench_as_of(directory, parents=200, children=10, revisions=50, queries=500):
+    fresh_database(directory, "history.db")
+    rows = [{"parent_item": f"A{p}", "child_item": f"C{p}-{c}", "quantity": 1}
+            for p in range(parents) for c in range(children)]
+    numbers = pyPLM.import_bom(rows)["item_numbers"]
+    conn = pyPLM.get_db_connection()
+    midpoint = None
+    for r in range(revisions):
+        with pyPLM.db_pool.transaction() as conn:
+            conn.executemany("UPDATE bom_links SET quantity = ? WHERE parent_item = ? AND child_item = ?",
+                             [(r + 2, numbers[row["parent_item"]], numbers[row["child_item"]]) for row in rows])
+        if r == revisions // 2:
+            midpoint = conn.execute("SELECT strftime('%Y-%m-%dT%H:%M:%f', 'now')").fetchone()[0]
+    history_rows = conn.execute("SELECT COUNT(*) FROM bom_link_history").fetchone()[0]
+    targets = [numbers[f"A{i % parents}"] for i in range(queries)]
+
+    def as_of(ops):
+        for parent in targets[:ops]:
+            pyPLM.get_bom_as_of(parent, midpoint)
+
+    def replay(ops):
+        # Baseline: read every version of the parent's links and keep the latest one before midpoint
+        for parent in targets[:ops]:
+            bom = {}
+            for row in conn.execute("SELECT child_item, quantity, effective_from FROM bom_link_history "
+                                    "WHERE parent_item = ? ORDER BY effective_from", (parent,)):
+                if row[2] <= midpoint:
+                    bom[row[0]] = row[1]
+    results = {"replay": {"as_of": timed(replay, queries)}, "indexed": {"as_of": timed(as_of, queries)}}
+    pyPLM.close_db_connections()
+    return history_rows, results
+
+# === In-memory graph footprint ===
+def synthetic_links(count, fan_out=10):
+    for i in range(count):
+        yield f"P{i // fan_out:07d}", f"P{i + 1:07d}", 1 + i % 3
+
+def build_item_graph(links):
+    # Item/BOM objects wired as load_bom_links would, without a DB round-trip per Item
+    items = {}
+    def node(number):
+        item = items.get(number)
+        if item is None:
+            item = items[number] = pyPLM.Item(number)
+        return item
+    for parent, child, qty in links:
+        parent, child = node(parent), node(child)
+        parent.bom.add_item(child, qty)
+        child.upper_level = parent
+    return items
+
+def measure_memory(build):
+    # Timed untraced; tracemalloc slows allocation-heavy builds several times over
+    start = time.perf_counter()
+    graph = build()
+    elapsed = time.perf_counter() - start
+    del graph
+    tracemalloc.start()
+    graph = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del graph
+    return {"bytes": size, "seconds": round(elapsed, 3)}
+
+def bench_graph_memory(links):
+    results = {
+        "item_bom": measure_memory(lambda: build_item_graph(synthetic_links(links))),
+        "compact": measure_memory(lambda: pyPLM.CompactBOMGraph.from_links(synthetic_links(links))),
+    }
+    for r in results.values():
+        r["bytes_per_link"] = round(r["bytes"] / links, 1)
+    return results
+
+# === Data layer suite ===
+def synthetic_product(depth, fan_out, shared=0.0, seed=0):
+    # One top-level assembly, fan_out children per assembly down to depth levels.
+    # With probability `shared` a child slot reuses an assembly already placed on
+    # that level, so subassemblies end up with several parents (a DAG, never a cycle,
+    # since links only ever point one level down).
+    rng = random.Random(seed)
+    levels = [["N0"]]
+    links = []
+    for level in range(depth):
+        below = []
+        for parent in levels[-1]:
+            children = set()
+            for _ in range(fan_out):
+                if below and rng.random() < shared:
+                    child = rng.choice(below)
+                    if child in children:
+                        continue
+                else:
+                    child = f"N{level + 1}-{len(below)}"
+                    below.append(child)
+                children.add(child)
+                links.append((parent, child, rng.randint(1, 4)))
+        levels.append(below)
+    return [key for level in levels for key in level], links
+
+def bench_data_layer(path, depth, fan_out, shared, seed, reads, repeat):
+    pyPLM.use_database(path)
+    pyPLM.create_database()
+    pyPLM.metrics.reset()
+    keys, links = synthetic_product(depth, fan_out, shared, seed)
+    items = {}
+
+    def create_item(key):
+        item = pyPLM.Item()
+        pyPLM.add_item_to_db(item)
+        items[key] = item
+
+    results = {"item_create": sampled(create_item, ((key,) for key in keys))}
+    results["bom_link_insert"] = sampled(
+        pyPLM.add_bom_link_to_db,
+        ((items[parent].item_number, items[child].item_number, qty) for parent, child, qty in links))
+
+    # A fresh, unlinked BOM per run; only load_bom_links itself is timed
+    numbers = [item.item_number for item in items.values()]
+    samples = []
+    for _ in range(repeat):
+        bom = pyPLM.BOM()
+        for number in numbers:
+            bom.add_item(pyPLM.Item(number))
+        samples += sampled(pyPLM.load_bom_links, [(bom,)])
+    results["load_bom_links"] = samples
+
+    rng = random.Random(seed)
+    targets = [rng.choice(numbers) for _ in range(reads)]
+    samples = []
+    for number in targets:
+        pyPLM.item_state_cache.clear()
+        samples += sampled(pyPLM.get_item_state, [(number,)])
+    results["state_read"] = samples
+    results["state_read_cached"] = sampled(pyPLM.get_item_state, ((number,) for number in targets))
+    # Legal transitions only: leaf parts walked Draft -> In Review -> Released -> Obsolete
+    parents = {items[parent].item_number for parent, _, _ in links}
+    leaves = [number for number in numbers if number not in parents]
+    rng.shuffle(leaves)
+    updates = [(number, state) for number in leaves for state in ("In Review", "Released", "Obsolete")][:reads]
+    rejected = []
+    def update_state(number, state):
+        if not pyPLM.update_item_state(number, state):
+            rejected.append(number)
+    results["state_update"] = sampled(update_state, updates)
+
+    def create_change_request(number):
+        cr = pyPLM.ChangeRequest(items[number], "Benchmark change", 100, 5)
+        pyPLM.add_change_request_to_db(cr)
+    by_number = {item.item_number: key for key, item in items.items()}
+    results["cr_create"] = sampled(create_change_request, ((by_number[number],) for number in targets))
+
+    # The data layer logs and swallows most DB errors; surface them so a broken run is not mistaken for a fast one
+    errors = {name: m["errors"] for name, m in pyPLM.metrics.snapshot().items() if m["errors"]}
+    if rejected:
+        errors["update_item_state_rejected"] = len(rejected)
+    pyPLM.close_db_connections()
+    product = {"depth": depth, "fan_out": fan_out, "shared": shared, "seed": seed,
+               "items": len(keys), "links": len(links)}
+    return product, {op: latency_stats(samples) for op, samples in results.items()}, errors
+
+def print_latencies(title, results):
+    print(f"== {title} ==")
+    for op, r in results.items():
+        print(f"{op:<18} {r['ops']:>8} ops  {r['ops_per_sec']:>10} ops/s  "
+              f"p50 {r['p50_ms']:>8.3f} ms  p99 {r['p99_ms']:>8.3f} ms")
+
+# === Document versions ===
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def bench_document_versions(directory, revisions, lines=4000, reads=500, seed=0):
+    # One text document revised `revisions` times, a few lines edited or added per
+    # revision. Disk use is the vault after garbage collection against storing every
+    # version whole; reads fetch random historical versions and the current one.
+    fresh_database(directory, "versions.db")
+    rng = random.Random(seed)
+    body = [f"{i:05d} Requirement text for clause {i}, tolerance {rng.randint(1, 99)} um\n" for i in range(lines)]
+    expected = []
+    def store(revision):
+        for _ in range(rng.randint(1, 5)):
+            i = rng.randrange(len(body))
+            body[i] = f"{i:05d} Revised in {revision}: tolerance {rng.randint(1, 99)} um\n"
+        if rng.random() < 0.3:
+            body.insert(rng.randrange(len(body)), f"Note added in revision {revision}\n")
+        content = "".join(body).encode()
+        expected.append(content)
+        pyPLM.store_document("DOC-1", io.BytesIO(content))
+    results = {"store": sampled(store, ((r,) for r in range(revisions)))}
+    pyPLM.collect_document_garbage()
+    versions = [rng.randint(1, revisions) for _ in range(reads)]
+    def read(version):
+        with pyPLM.open_document("DOC-1", version) as f:
+            f.read()
+    results["read_version"] = sampled(read, ((v,) for v in versions))
+    results["read_current"] = sampled(read, ((None,) for _ in versions))
+    for version in versions[:20]:
+        assert pyPLM.read_document_version("DOC-1", version) == expected[version - 1]
+    disk = {"revisions": revisions, "keyframe_interval": pyPLM.KEYFRAME_INTERVAL,
+            "full_copies_bytes": sum(len(content) for content in expected),
+            "vault_bytes": directory_size(pyPLM.document_vault.root)}
+    disk["ratio"] = round(disk["vault_bytes"] / disk["full_copies_bytes"], 4)
+    pyPLM.close_db_connections()
+    return disk, {op: latency_stats(samples) for op, samples in results.items()}
+
+def print_results(title, results):
+    print(f"== {title} ==")
+    for variant, ops in results.items():
+        for op, r in ops.items():
+            print(f"{variant:>8} {op:<8} {r['ops']:>8} ops  {r['seconds']:>8.3f}s  {r['ops_per_sec']:>10} ops/s")
+
+SUITES = ("data", "pool", "import", "as-of", "memory", "versions")
+
+def run_info(args):
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "argv": sys.argv[1:],
+            "args": vars(args)}
+
+def main():
+    parser = argparse.ArgumentParser(description="pyPLM data layer benchmarks")
+    parser.add_argument("--suites", default=",".join(SUITES),
+                        help=f"comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--links", type=int, default=1000000)
+    parser.add_argument("--depth", type=int, default=4, help="levels below the top-level assembly")
+    parser.add_argument("--fan-out", type=int, default=6, help="children per assembly")
+    parser.add_argument("--shared", type=float, default=0.2, help="chance a child slot reuses a subassembly")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reads", type=int, default=2000, help="state reads/updates and CRs to time")
+    parser.add_argument("--repeat", type=int, default=20, help="load_bom_links runs to time")
+    parser.add_argument("--revisions", type=int, default=300, help="document versions to store")
+    parser.add_argument("--database", help="run the data suite against this file instead of a fresh plm_database.db")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    report = {"run": run_info(args), "suites": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        if "data" in suites:
+            path = args.database or os.path.join(directory, "plm_database.db")
+            product, results, errors = bench_data_layer(path, args.depth, args.fan_out, args.shared,
+                                                        args.seed, args.reads, args.repeat)
+            print_latencies(f"data layer, {product['items']} items, {product['links']} links", results)
+            if errors:
+                print(f"errors: {errors}")
+            report["suites"]["data"] = {"product": product, "results": results, "errors": errors}
+        if "pool" in suites:
+            results = bench_connection_pool(directory, args.ops)
+            print_results("connection pool", results)
+            report["suites"]["pool"] = results
+        if "import" in suites:
+            results = bench_bulk_import(directory, args.ops * 10)
+            print_results("bom import", results)
+            report["suites"]["import"] = results
+        if "as-of" in suites:
+            history_rows, results = bench_as_of(directory)
+            print_results(f"bom as-of, {history_rows} history rows", results)
+            report["suites"]["as-of"] = {"history_rows": history_rows, "results": results}
+        if "versions" in suites:
+            disk, results = bench_document_versions(directory, args.revisions, seed=args.seed)
+            print_latencies(f"document versions, {disk['revisions']} revisions", results)
+            print(f"{disk['vault_bytes'] / 1e6:.1f} MB stored for {disk['full_copies_bytes'] / 1e6:.1f} MB "
+                  f"of versions ({disk['ratio']:.1%})")
+            report["suites"]["versions"] = {"disk": disk, "results": results}
+    if "memory" in suites:
+        results = bench_graph_memory(args.links)
+        print(f"== in-memory graph, {args.links} links ==")
+        for variant, r in results.items():
+            print(f"{variant:>8} {r['bytes'] / 1e6:>10.1f} MB  {r['bytes_per_link']:>8} B/link  {r['seconds']:>8.3f}s")
+        report["suites"]["memory"] = {"links": args.links, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,351 @@
 # Last Updated: 2025-04-15 08:38:16 UTC
 # Author: nexerax-collab
 
+import io
+import os
+import csv
+import mmap
+import shutil
+import json
+import time
+import zlib
+import struct
 import sqlite3
 import logging
+import sys
+import queue
+import atexit
+import hashlib
+import inspect
+import functools
+import threading
+import weakref
+import logging.handlers
+from array import array
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from datetime import timezone
+from itertools import accumulate, islice
+from concurrent.futures import ProcessPoolExecutor
 
-logging.basicConfig(filename='plm_tool.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+try:
+    import PyPDF2
+except ImportError:  # only needed to index PDF documents
+    PyPDF2 = None
+
+# === Logging ===
+# Importing pyPLM configures nothing; call configure_logging() to write plm_tool.log.
+logger = logging.getLogger("pyPLM")
+logger.addHandler(logging.NullHandler())
+
+# Structured fields accepted through `extra=` and emitted by JsonFormatter
+LOG_FIELDS = ("operation", "item_number", "duration_ms", "rows")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats in the caller's thread; hand the record over
+    # untouched so message formatting and JSON encoding happen on the listener thread.
+    def prepare(self, record):
+        return record
+
+log_listener = None
+log_queue_handler = None
+log_propagate = None
+
+def configure_logging(filename="plm_tool.log", level=logging.INFO, structured=True, handler=None):
+    # Callers only enqueue records; a QueueListener thread formats and writes them.
+    global log_listener, log_queue_handler, log_propagate
+    shutdown_logging()
+    handler = handler or logging.FileHandler(filename)
+    handler.setFormatter(JsonFormatter() if structured else
+                         logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    records = queue.SimpleQueue()
+    log_queue_handler = DeferredQueueHandler(records)
+    logger.addHandler(log_queue_handler)
+    logger.setLevel(level)
+    # Records go to our file only, not also through the root logger's handlers
+    log_propagate, logger.propagate = logger.propagate, False
+    log_listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    log_listener.start()
+    return log_listener
+
+def shutdown_logging():
+    # Flushes queued records; registered with atexit
+    global log_listener, log_queue_handler, log_propagate
+    if log_queue_handler is not None:
+        logger.removeHandler(log_queue_handler)
+        log_queue_handler = None
+    if log_propagate is not None:
+        logger.propagate = log_propagate
+        log_propagate = None
+    if log_listener is not None:
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+atexit.register(shutdown_logging)
+
+# === Metrics ===
+# Upper bounds in seconds, Prometheus-style; the last bucket is +Inf
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+class OperationMetrics:
+    __slots__ = ("count", "errors", "rows", "seconds", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds, rows, error):
+        self.count += 1
+        self.errors += error
+        self.rows += rows
+        self.seconds += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = True
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def observe(self, operation, seconds, rows=0, error=False):
+        with self.lock:
+            metrics = self.operations.get(operation)
+            if metrics is None:
+                metrics = self.operations[operation] = OperationMetrics()
+            metrics.observe(seconds, rows, error)
+
+    def record_error(self, operation):
+        # For functions that catch and log their own errors instead of raising
+        if self.enabled:
+            with self.lock:
+                metrics = self.operations.get(operation)
+                if metrics is None:
+                    metrics = self.operations[operation] = OperationMetrics()
+                metrics.errors += 1
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {name: {"count": m.count, "errors": m.errors, "rows": m.rows,
+                           "mean_ms": round(m.seconds * 1000 / m.count, 3) if m.count else None,
+                           "buckets": dict(zip(LATENCY_BUCKETS + (float("inf"),), m.buckets))}
+                    for name, m in self.operations.items()}
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP pyplm_operation_duration_seconds Latency of pyPLM data layer operations.",
+            "# TYPE pyplm_operation_duration_seconds histogram",
+        ]
+        with self.lock:
+            operations = sorted(self.operations.items())
+            for name, m in operations:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, m.buckets):
+                    cumulative += count
+                    lines.append(f'pyplm_operation_duration_seconds_bucket{{operation="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'pyplm_operation_duration_seconds_bucket{{operation="{name}",le="+Inf"}} {m.count}')
+                lines.append(f'pyplm_operation_duration_seconds_sum{{operation="{name}"}} {m.seconds:.6f}')
+                lines.append(f'pyplm_operation_duration_seconds_count{{operation="{name}"}} {m.count}')
+            lines.append("# HELP pyplm_operation_errors_total Failed pyPLM data layer operations.")
+            lines.append("# TYPE pyplm_operation_errors_total counter")
+            lines.extend(f'pyplm_operation_errors_total{{operation="{name}"}} {m.errors}' for name, m in operations)
+            lines.append("# HELP pyplm_operation_rows_total Rows returned or written by pyPLM data layer operations.")
+            lines.append("# TYPE pyplm_operation_rows_total counter")
+            lines.extend(f'pyplm_operation_rows_total{{operation="{name}"}} {m.rows}' for name, m in operations)
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def instrumented(name=None, rows=None):
+    # Records count, latency, rows (rows(result) when given) and errors for the wrapped
+    # function. Returned generators are timed across their iteration and count
+    # yielded rows. With metrics.enabled False the cost is one attribute check.
+    def decorator(fn):
+        operation = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                metrics.observe(operation, time.perf_counter() - start, 0, True)
+                raise
+            if inspect.isgenerator(result):
+                return instrumented_iteration(operation, result, time.perf_counter() - start)
+            metrics.observe(operation, time.perf_counter() - start, rows(result) if rows else 0)
+            return result
+        return wrapper
+    return decorator
+
+def instrumented_iteration(operation, iterator, seconds):
+    # Only time spent inside the generator counts, not the consumer's work between rows
+    count = 0
+    error = False
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                return
+            except BaseException:
+                seconds += time.perf_counter() - start
+                error = True
+                raise
+            seconds += time.perf_counter() - start
+            count += 1
+            yield row
+    finally:
+        iterator.close()
+        metrics.observe(operation, seconds, count, error)
+
+@contextmanager
+def timed_operation(operation):
+    # For ad-hoc blocks: `with timed_operation("x") as op: ...; op["rows"] = n`
+    op = {"rows": 0}
+    if not metrics.enabled:
+        yield op
+        return
+    start = time.perf_counter()
+    try:
+        yield op
+    except BaseException:
+        metrics.observe(operation, time.perf_counter() - start, op["rows"], True)
+        raise
+    metrics.observe(operation, time.perf_counter() - start, op["rows"])
+
+DB_PATH = 'plm_database.db'
+
+# === Connection Pool ===
+class ConnectionPool:
+    # One long-lived connection per thread, tuned once when it is opened.
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA busy_timeout=30000",
+    )
+
+    def __init__(self, db_path=DB_PATH, timeout=30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._pid = os.getpid()
+
+    def connect(self):
+        if os.getpid() != self._pid:
+            # Forked child: never reuse the parent's sqlite handles
+            self._local = threading.local()
+            self._connections = []
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: we issue BEGIN/COMMIT ourselves in transaction()
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, mode="IMMEDIATE"):
+        conn = self.connect()
+        if self._local.depth:
+            # Nested use joins the outer transaction
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute(f"BEGIN {mode}")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+            self._local.conn = None
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+db_pool = ConnectionPool()
+
+def use_database(db_path):
+    global db_pool, document_vault
+    db_pool.close_all()
+    db_pool = ConnectionPool(db_path)
+    document_vault = DocumentVault(vault_path_for(db_path))
+    item_state_cache.clear()
+    return db_pool
+
+def close_db_connections():
+    db_pool.close_all()
 
 def get_db_connection():
-    conn = sqlite3.connect('plm_database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connect()
 
+@instrumented()
 def create_database():
-    conn = get_db_connection()
+    migrate_database()
+
+def create_tables(conn):
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS items (
@@ -50,42 +383,562 @@ def create_database():
             FOREIGN KEY (child_item) REFERENCES items(item_number)
         )
     ''')
-    conn.commit()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+
+# === Schema Migrations ===
+def add_bom_and_cr_indexes(conn):
+    # Collapse duplicate parent/child links first, keeping the most recent row
+    # (the one load_bom_links would have applied last). The rows removed are kept
+    # in bom_links_duplicates so the upgrade loses nothing.
+    duplicates = "rowid NOT IN (SELECT MAX(rowid) FROM bom_links GROUP BY parent_item, child_item)"
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bom_links_duplicates (
+            parent_item TEXT,
+            child_item TEXT,
+            quantity INTEGER,
+            original_rowid INTEGER,
+            removed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute(f"INSERT INTO bom_links_duplicates (parent_item, child_item, quantity, original_rowid) "
+                 f"SELECT parent_item, child_item, quantity, rowid FROM bom_links WHERE {duplicates}")
+    removed = conn.execute(f"DELETE FROM bom_links WHERE {duplicates}").rowcount
+    if removed:
+        logger.warning("Collapsed %s duplicate BOM links; the removed rows are in bom_links_duplicates", removed,
+                       extra={"operation": "migrate", "rows": removed})
+    # The unique (parent, child) index also serves parent-only lookups
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bom_links_parent_child ON bom_links (parent_item, child_item)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bom_links_child ON bom_links (child_item)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_requests_item_status ON change_requests (item_number, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_requests_status ON change_requests (status)")
+
+def add_bom_closure(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bom_closure (
+            ancestor TEXT NOT NULL,
+            descendant TEXT NOT NULL,
+            PRIMARY KEY (ancestor, descendant)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bom_closure_descendant ON bom_closure (descendant, ancestor)")
+    rebuild_bom_closure()
+
+def add_bom_link_triggers(conn):
+    # bom_closure holds every (ancestor, descendant) pair reachable through bom_links.
+    # Every insert into bom_links, from any writer, is first rejected if the child
+    # already reaches the parent, then connects every ancestor of the parent (and
+    # the parent itself) to every descendant of the child (and the child itself).
+    # Deletes and re-pointed links are handled by add_bom_closure_maintenance.
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS bom_links_reject_cycle BEFORE INSERT ON bom_links
+        WHEN NEW.parent_item = NEW.child_item
+          OR EXISTS (SELECT 1 FROM bom_closure WHERE ancestor = NEW.child_item AND descendant = NEW.parent_item)
+        BEGIN
+            SELECT RAISE(ABORT, '{BOM_CYCLE_MESSAGE}');
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS bom_links_extend_closure AFTER INSERT ON bom_links
+        BEGIN
+            INSERT OR IGNORE INTO bom_closure (ancestor, descendant)
+            SELECT a.ancestor, d.descendant
+            FROM (SELECT ancestor FROM bom_closure WHERE descendant = NEW.parent_item
+                  UNION ALL SELECT NEW.parent_item) a,
+                 (SELECT descendant FROM bom_closure WHERE ancestor = NEW.child_item
+                  UNION ALL SELECT NEW.child_item) d;
+        END
+    ''')
+
+# Open-ended effectivity; compares greater than any real timestamp
+EFFECTIVE_FOREVER = "9999-12-31T23:59:59.999"
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+
+def add_revision_history(conn):
+    # Every version of an item (revision, state) and of a BOM link (quantity) gets a
+    # row valid for [effective_from, effective_to). Triggers close the current row
+    # and open a new one on change, so "as of T" is a range lookup, not a replay.
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS item_history (
+            item_number TEXT NOT NULL,
+            revision TEXT,
+            state TEXT,
+            effective_from TEXT NOT NULL,
+            effective_to TEXT NOT NULL DEFAULT '{EFFECTIVE_FOREVER}'
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS bom_link_history (
+            parent_item TEXT NOT NULL,
+            child_item TEXT NOT NULL,
+            quantity INTEGER,
+            effective_from TEXT NOT NULL,
+            effective_to TEXT NOT NULL DEFAULT '{EFFECTIVE_FOREVER}'
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_history_item ON item_history (item_number, effective_to, effective_from)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bom_link_history_parent ON bom_link_history (parent_item, effective_to, effective_from)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bom_link_history_child ON bom_link_history (child_item, effective_to)")
+    # History starts now for whatever is already in the database
+    conn.execute(f"INSERT INTO item_history (item_number, revision, state, effective_from) "
+                 f"SELECT item_number, revision, state, {NOW_SQL} FROM items")
+    conn.execute(f"INSERT INTO bom_link_history (parent_item, child_item, quantity, effective_from) "
+                 f"SELECT parent_item, child_item, quantity, {NOW_SQL} FROM bom_links")
+    close_item = (f"UPDATE item_history SET effective_to = {NOW_SQL} "
+                  f"WHERE item_number = OLD.item_number AND effective_to = '{EFFECTIVE_FOREVER}';")
+    open_item = (f"INSERT INTO item_history (item_number, revision, state, effective_from) "
+                 f"VALUES (NEW.item_number, NEW.revision, NEW.state, {NOW_SQL});")
+    close_link = (f"UPDATE bom_link_history SET effective_to = {NOW_SQL} WHERE parent_item = OLD.parent_item "
+                  f"AND child_item = OLD.child_item AND effective_to = '{EFFECTIVE_FOREVER}';")
+    open_link = (f"INSERT INTO bom_link_history (parent_item, child_item, quantity, effective_from) "
+                 f"VALUES (NEW.parent_item, NEW.child_item, NEW.quantity, {NOW_SQL});")
+    triggers = {
+        "items_history_insert": ("AFTER INSERT ON items", "", open_item),
+        "items_history_update": ("AFTER UPDATE OF revision, state ON items",
+                                 "WHEN OLD.revision IS NOT NEW.revision OR OLD.state IS NOT NEW.state",
+                                 close_item + open_item),
+        "items_history_delete": ("AFTER DELETE ON items", "", close_item),
+        "bom_links_history_insert": ("AFTER INSERT ON bom_links", "", open_link),
+        "bom_links_history_update": ("AFTER UPDATE OF quantity ON bom_links",
+                                     "WHEN OLD.quantity IS NOT NEW.quantity", close_link + open_link),
+        "bom_links_history_delete": ("AFTER DELETE ON bom_links", "", close_link),
+    }
+    for name, (event, condition, body) in triggers.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} {condition} BEGIN {body} END")
+
+def add_baselines(conn):
+    # Baselines are trees of content-addressed nodes: a node's hash covers its item,
+    # revision and its children's (item, quantity, hash). Identical subtrees hash the
+    # same, so a new baseline only stores the nodes that changed.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS baseline_nodes (
+            hash TEXT PRIMARY KEY,
+            item_number TEXT NOT NULL,
+            revision TEXT,
+            children TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS baselines (
+            name TEXT PRIMARY KEY,
+            baseline_type TEXT NOT NULL,
+            root_item TEXT NOT NULL,
+            root_hash TEXT NOT NULL,
+            previous TEXT,
+            created_at TEXT NOT NULL,
+            nodes_added INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_baselines_root ON baselines (root_item, created_at)")
+    # Change detection since the previous baseline scans history by time
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_history_from ON item_history (effective_from)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_history_to ON item_history (effective_to)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bom_link_history_from ON bom_link_history (effective_from)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bom_link_history_to ON bom_link_history (effective_to)")
+
+def add_bom_version(conn):
+    # A counter bumped by every bom_links change, so derived results can be cached per structure version
+    conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('bom_version', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS bom_links_version_{event.lower()} AFTER {event} ON bom_links "
+                     f"BEGIN UPDATE sequences SET value = value + 1 WHERE name = 'bom_version'; END")
+
+# Tables mirrored into change_events: (key expression over a row alias, payload columns).
+# These hold every piece of primary data pyPLM writes. Derived tables (bom_closure,
+# the history tables, baselines, the text index, sequences) are left out: they are
+# rebuilt from these rather than replayed.
+EVENT_TABLES = {
+    "items": ("{row}.item_number", ("item_number", "revision", "upper_level", "state")),
+    "bom_links": ("{row}.parent_item || '/' || {row}.child_item", ("parent_item", "child_item", "quantity")),
+    "change_requests": ("{row}.change_request_number",
+                        ("change_request_number", "item_number", "reason", "cost_impact", "timeline_impact", "status")),
+    "documents": ("{row}.document_number",
+                  ("document_number", "version", "file_path", "content_hash", "size", "stored_at")),
+    "document_versions": ("{row}.document_number || '/' || {row}.version",
+                          ("document_number", "version", "kind", "base_version", "chain", "content_hash",
+                           "object_hash", "size", "file_path", "stored_at")),
+    "item_documents": ("{row}.item_number || '/' || {row}.document_number", ("item_number", "document_number", "role")),
+    "change_records": ("{row}.id", ("id", "title", "description", "impact", "status", "phase",
+                                    "created_by", "created_at", "updated_at", "actions")),
+}
+
+def add_event_triggers(conn, tables):
+    for table in tables:
+        key, columns = EVENT_TABLES[table]
+        def payload(row):
+            return "json_object(" + ", ".join(f"'{c}', {row}.{c}" for c in columns) + ")"
+        # Snapshot what is already there so a replay starts from the full state
+        conn.execute(f"INSERT INTO change_events (table_name, operation, row_key, payload, created_at) "
+                     f"SELECT '{table}', 'insert', {key.format(row=table)}, {payload(table)}, {NOW_SQL} FROM {table}")
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            rekey = ""
+            if event == "UPDATE":
+                # A key change is logged as delete-old + update-new so projections stay exact
+                rekey = (f"INSERT INTO change_events (table_name, operation, row_key, payload, created_at) "
+                         f"SELECT '{table}', 'delete', {key.format(row='OLD')}, {payload('OLD')}, {NOW_SQL} "
+                         f"WHERE {key.format(row='OLD')} IS NOT {key.format(row='NEW')};")
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_event_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    {rekey}
+                    INSERT INTO change_events (table_name, operation, row_key, payload, created_at)
+                    VALUES ('{table}', '{event.lower()}', {key.format(row=row)}, {payload(row)}, {NOW_SQL});
+                END
+            ''')
+
+def add_change_events(conn):
+    # Append-only log written by triggers, so every mutation lands in the same
+    # transaction as its event. AUTOINCREMENT keeps seq strictly increasing and
+    # never reused; writers are serialized, so seq order is commit order.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            payload TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    add_event_triggers(conn, ("items", "bom_links", "change_requests"))
+
+def move_documents_to_vault(conn):
+    # Document bodies move out of the row into the content-addressed vault; the
+    # table keeps metadata and the blob hash, so listing documents never reads a file.
+    conn.execute('''
+        CREATE TABLE documents_metadata (
+            document_number TEXT PRIMARY KEY,
+            version INTEGER,
+            file_path TEXT,
+            content_hash TEXT,
+            size INTEGER,
+            stored_at TEXT
+        )
+    ''')
+    for row in conn.execute("SELECT document_number, version, file_path, content FROM documents").fetchall():
+        content_hash = size = None
+        if row["content"] is not None:
+            content = row["content"]
+            content_hash, size = document_vault.put(io.BytesIO(content if isinstance(content, bytes) else str(content).encode()))
+        conn.execute(f"INSERT INTO documents_metadata VALUES (?, ?, ?, ?, ?, {NOW_SQL})",
+                     (row["document_number"], row["version"], row["file_path"], content_hash, size))
+    conn.execute("DROP TABLE documents")
+    conn.execute("ALTER TABLE documents_metadata RENAME TO documents")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)")
+
+def add_document_search(conn):
+    # One row per indexed (document_number, version); its rowid is the rowid of the
+    # extracted text in the FTS5 table, so search results join back in one step.
+    # Versions that yielded no text are recorded too, so they are not retried.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS document_text_index (
+            id INTEGER PRIMARY KEY,
+            document_number TEXT NOT NULL,
+            version INTEGER,
+            content_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            indexed_at TEXT NOT NULL,
+            UNIQUE (document_number, version)
+        )
+    ''')
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS document_text USING fts5(body, tokenize = 'porter unicode61')")
+
+def add_document_versions(conn):
+    # Every stored version of a document. A "full" version's object is its whole
+    # body in the vault; a "delta" version's object is a delta against base_version.
+    # chain counts the deltas back to the nearest full version, which bounds how many
+    # deltas a read applies. The current version's whole body is always in the vault
+    # too (documents.content_hash), so reading it never applies a delta.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS document_versions (
+            document_number TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            base_version INTEGER,
+            chain INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            object_hash TEXT NOT NULL,
+            size INTEGER,
+            file_path TEXT,
+            stored_at TEXT NOT NULL,
+            PRIMARY KEY (document_number, version)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_document_versions_object ON document_versions (object_hash)")
+    conn.execute("UPDATE documents SET version = 1 WHERE version IS NULL AND content_hash IS NOT NULL")
+    conn.execute('''
+        INSERT OR IGNORE INTO document_versions (document_number, version, kind, base_version, chain,
+                                                 content_hash, object_hash, size, file_path, stored_at)
+        SELECT document_number, version, 'full', NULL, 0, content_hash, content_hash, size, file_path, stored_at
+        FROM documents WHERE content_hash IS NOT NULL
+    ''')
+
+def add_item_documents(conn):
+    # Item-to-document links, indexed both ways: documents of an item via the
+    # primary key, items using a document via the reverse index. document_version is
+    # a counter bumped by every change to links or documents, so cached document
+    # lists can be keyed on it the same way structural results key on bom_version.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS item_documents (
+            item_number TEXT NOT NULL,
+            document_number TEXT NOT NULL,
+            role TEXT,
+            PRIMARY KEY (item_number, document_number)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_documents_document ON item_documents (document_number, item_number)")
+    conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('document_version', 0)")
+    for table in ("item_documents", "documents"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} "
+                         f"BEGIN UPDATE sequences SET value = value + 1 WHERE name = 'document_version'; END")
+
+def add_change_records(conn):
+    # Change records for the change management app (cr-module.py), one row each, so
+    # creating or advancing a change writes only that change
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_records (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            impact TEXT,
+            status TEXT NOT NULL,
+            phase TEXT NOT NULL,
+            created_by TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            actions TEXT NOT NULL DEFAULT '[]'
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_records_phase_status ON change_records (phase, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_records_status ON change_records (status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_records_created_by ON change_records (created_by)")
+
+def add_bom_closure_maintenance(conn):
+    # Removing or re-pointing a link can disconnect pairs that bom_closure still
+    # holds. The closure rows of every item at or above the affected parent(s) are
+    # dropped and rebuilt from bom_links; the walk up uses bom_links too, since the
+    # closure rows it would otherwise read are the ones being replaced. Items not
+    # above the parent keep their rows, so the work is bounded by those subtrees.
+    def recompute(start):
+        up = (f"WITH RECURSIVE up (item) AS ({start} UNION "
+              f"SELECT b.parent_item FROM bom_links b JOIN up ON b.child_item = up.item) SELECT item FROM up")
+        return f'''
+            DELETE FROM bom_closure WHERE ancestor IN (SELECT item FROM ({up}));
+            INSERT OR IGNORE INTO bom_closure (ancestor, descendant)
+            SELECT ancestor, descendant FROM (
+                WITH RECURSIVE reach (ancestor, descendant) AS (
+                    SELECT parent_item, child_item FROM bom_links WHERE parent_item IN (SELECT item FROM ({up}))
+                    UNION
+                    SELECT r.ancestor, b.child_item FROM reach r JOIN bom_links b ON b.parent_item = r.descendant
+                )
+                SELECT ancestor, descendant FROM reach
+            );
+        '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS bom_links_reject_cycle_update
+        BEFORE UPDATE OF parent_item, child_item ON bom_links
+        WHEN NEW.parent_item = NEW.child_item
+          OR EXISTS (SELECT 1 FROM bom_closure WHERE ancestor = NEW.child_item AND descendant = NEW.parent_item)
+        BEGIN
+            SELECT RAISE(ABORT, '{BOM_CYCLE_MESSAGE}');
+        END
+    ''')
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS bom_links_shrink_closure AFTER DELETE ON bom_links "
+                 f"BEGIN {recompute('SELECT OLD.parent_item')} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS bom_links_move_closure AFTER UPDATE OF parent_item, child_item ON bom_links "
+                 f"WHEN OLD.parent_item IS NOT NEW.parent_item OR OLD.child_item IS NOT NEW.child_item "
+                 f"BEGIN {recompute('SELECT OLD.parent_item UNION SELECT NEW.parent_item')} END")
+    # Drop any pairs left behind by deletes made before this migration
+    rebuild_bom_closure()
+
+def narrow_bom_closure_maintenance(conn):
+    # Rebuilding every closure row above the old parent costs as much as a full
+    # rebuild for links near a large root. Only pairs (a, d) with a at or above the
+    # old parent and d at or below the old child can lose their path, and neither
+    # side's own rows change: nothing above the parent passes through the link,
+    # and nothing below the child can reach back up to it. So those candidates are
+    # deleted, and each one comes back if d is still reached from some x outside
+    # the candidate ancestors whose parent link starts at a or below it.
+    ancestors = ("SELECT ancestor FROM bom_closure WHERE descendant = OLD.parent_item "
+                 "UNION SELECT OLD.parent_item")
+    descendants = ("SELECT descendant FROM bom_closure WHERE ancestor = OLD.child_item "
+                   "UNION SELECT OLD.child_item")
+    reachable = (f"SELECT descendant AS via, descendant FROM ({descendants}) "
+                 f"UNION ALL SELECT ancestor, descendant FROM bom_closure WHERE descendant IN ({descendants})")
+    shrink = f'''
+        DELETE FROM bom_closure WHERE ancestor IN ({ancestors}) AND descendant IN ({descendants});
+        INSERT OR IGNORE INTO bom_closure (ancestor, descendant)
+        SELECT b.parent_item, r.descendant FROM ({reachable}) r
+        JOIN bom_links b ON b.child_item = r.via
+        WHERE b.parent_item IN ({ancestors});
+        INSERT OR IGNORE INTO bom_closure (ancestor, descendant)
+        SELECT c.ancestor, r.descendant FROM ({reachable}) r
+        JOIN bom_links b ON b.child_item = r.via
+        JOIN bom_closure c ON c.descendant = b.parent_item
+        WHERE b.parent_item IN ({ancestors});
+    '''
+    # A re-pointed link is a delete of the old pair followed by an insert of the new
+    extend = '''
+        INSERT OR IGNORE INTO bom_closure (ancestor, descendant)
+        SELECT a.ancestor, d.descendant
+        FROM (SELECT ancestor FROM bom_closure WHERE descendant = NEW.parent_item
+              UNION ALL SELECT NEW.parent_item) a,
+             (SELECT descendant FROM bom_closure WHERE ancestor = NEW.child_item
+              UNION ALL SELECT NEW.child_item) d;
+    '''
+    conn.execute("DROP TRIGGER IF EXISTS bom_links_shrink_closure")
+    conn.execute("DROP TRIGGER IF EXISTS bom_links_move_closure")
+    conn.execute(f"CREATE TRIGGER bom_links_shrink_closure AFTER DELETE ON bom_links BEGIN {shrink} END")
+    conn.execute(f"CREATE TRIGGER bom_links_move_closure AFTER UPDATE OF parent_item, child_item ON bom_links "
+                 f"WHEN OLD.parent_item IS NOT NEW.parent_item OR OLD.child_item IS NOT NEW.child_item "
+                 f"BEGIN {shrink} {extend} END")
+
+def add_document_events(conn):
+    # Documents, their versions and links, and change records joined the schema
+    # after the event log; mirror them too
+    add_event_triggers(conn, ("documents", "document_versions", "item_documents", "change_records"))
+
+# Append only; never renumber or edit a migration that has shipped
+MIGRATIONS = [
+    (1, "Base tables", create_tables),
+    (2, "BOM link and change request indexes", add_bom_and_cr_indexes),
+    (3, "BOM ancestor closure table", add_bom_closure),
+    (4, "BOM link cycle guard and closure triggers", add_bom_link_triggers),
+    (5, "Item and BOM link revision history", add_revision_history),
+    (6, "Baselines with content-addressed nodes", add_baselines),
+    (7, "BOM structure version counter", add_bom_version),
+    (8, "Append-only change event log", add_change_events),
+    (9, "Document bodies moved to the content-addressed vault", move_documents_to_vault),
+    (10, "Full-text index over extracted document text", add_document_search),
+    (11, "Document version history with delta storage", add_document_versions),
+    (12, "Item to document links", add_item_documents),
+    (13, "Change records for the change management app", add_change_records),
+    (14, "BOM closure upkeep on link delete and update", add_bom_closure_maintenance),
+    (15, "Change events for documents, document links and change records", add_document_events),
+    (16, "BOM closure upkeep limited to the pairs a removed link can affect", narrow_bom_closure_maintenance),
+]
+
+def get_schema_version(conn=None):
+    conn = conn or db_pool.connect()
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'").fetchone()
+    if not exists:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+@instrumented(rows=len)
+def migrate_database():
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        # One transaction per step; re-check the version under the write lock so
+        # concurrent processes upgrading the same file apply each step once.
+        with db_pool.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            if get_schema_version(conn) >= version:
+                continue
+            migration(conn)
+            conn.execute("INSERT INTO schema_migrations (version, description) VALUES (?, ?)", (version, description))
+        logger.info("Applied schema migration %s: %s", version, description, extra={"operation": "migrate"})
+        applied.append(version)
+    return applied
+
+# === Number Allocation ===
+# Seed query and floor used the first time a sequence is touched on an existing database
+SEQUENCES = {
+    "item": ("SELECT MAX(CAST(SUBSTR(item_number, 2) AS INTEGER)) FROM items", 0),
+    "change_request": ("SELECT MAX(change_request_number) FROM change_requests", 999),
+    "change_record": ("SELECT MAX(CAST(SUBSTR(id, 5) AS INTEGER)) FROM change_records WHERE id LIKE 'CHG-%'", 0),
+}
+
+@instrumented(rows=len)
+def allocate_numbers(name, count=1):
+    if count < 1:
+        raise ValueError("count must be at least 1")
+    # BEGIN IMMEDIATE takes the write lock up front, so allocation is atomic across threads and processes
+    with db_pool.transaction() as conn:
+        cursor = conn.execute("UPDATE sequences SET value = value + ? WHERE name = ?", (count, name))
+        if cursor.rowcount == 0:
+            seed_query, floor = SEQUENCES[name]
+            seed = conn.execute(seed_query).fetchone()[0] or floor
+            conn.execute("INSERT INTO sequences (name, value) VALUES (?, ?)", (name, seed + count))
+        last = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()[0]
+    return range(last - count + 1, last + 1)
+
+def format_item_number(number):
+    return f"P{number:04d}"
+
+def reserve_item_numbers(count):
+    return [format_item_number(n) for n in allocate_numbers("item", count)]
+
+def reserve_cr_numbers(count):
+    return list(allocate_numbers("change_request", count))
+
+BOM_CYCLE_MESSAGE = "BOM link would create a cycle"
+
+class BOMCycleError(ValueError):
+    pass
 
 class BOM:
-    def __init__(self):
+    def __init__(self, owner=None):
+        self.owner = owner
         self.items = {}
         self.quantities = {}
+        self.listeners = []
 
     def add_item(self, item, quantity=1):
         self.items[item.item_number] = item
         self.quantities[item.item_number] = quantity
+        self.notify()
 
     def change_quantity(self, item_number, new_quantity):
         if item_number in self.quantities:
             self.quantities[item_number] = new_quantity
+            self.notify()
+
+    def notify(self):
+        # Listeners registered as weakref.WeakMethod do not keep their owner alive;
+        # they are dropped here once it has been collected
+        for listener in list(self.listeners):
+            if isinstance(listener, weakref.WeakMethod):
+                callback = listener()
+                if callback is None:
+                    self.listeners.remove(listener)
+                    continue
+                callback(self)
+            else:
+                listener(self)
 
     def get_item(self, item_number):
         return self.items.get(item_number, None)
 
 class Item:
-    def __init__(self):
-        self.item_number = self.generate_item_number()
+    def __init__(self, item_number=None):
+        # Pass item_number to wrap an existing item without allocating a new number
+        self.item_number = item_number or self.generate_item_number()
         self.upper_level = None
-        self.bom = BOM()
+        self.bom = BOM(self)
         self.state = "Draft"
 
+    @instrumented()
     def generate_item_number(self):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT MAX(CAST(SUBSTR(item_number, 2) AS INTEGER)) FROM items")
-        last_number = cursor.fetchone()[0] or 0
-        return f"P{last_number + 1:04d}"
+        return format_item_number(allocate_numbers("item")[0])
 
     def add_lower_level_item(self, item, quantity=1):
+        # Persist first so a rejected (cyclic) link never reaches the in-memory BOM
+        add_bom_link_to_db(self.item_number, item.item_number, quantity)
         self.bom.add_item(item, quantity)
         item.upper_level = self
-        add_bom_link_to_db(self.item_number, item.item_number, quantity)
 
     def create_change_request(self, reason, cost_impact, timeline_impact):
         return ChangeRequest(self, reason, cost_impact, timeline_impact)
@@ -99,46 +952,379 @@ class ChangeRequest:
         self.timeline_impact = timeline_impact
         self.status = "Created"
 
+    @instrumented()
     def generate_cr_number(self):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT MAX(change_request_number) FROM change_requests")
-        last = cursor.fetchone()[0] or 999
-        return last + 1
+        return allocate_numbers("change_request")[0]
+
+    def analyze_impact(self):
+        return analyze_change_impact(self.item.item_number, self.change_request_number)
+
+# === Rollup ===
+class BOMRollup:
+    # Per-unit leaf quantities for every assembly visited, computed once per
+    # subassembly however many parents share it. BOM edits invalidate the edited
+    # assembly and its memoized ancestors only.
+    def __init__(self):
+        self.memo = {}
+        self.parents = {}
+        self.watched = {}
+
+    def quantities(self, item):
+        return dict(self.rollup(item, set()))
+
+    def cost(self, item, unit_costs):
+        return sum(qty * unit_costs.get(leaf, 0) for leaf, qty in self.rollup(item, set()).items())
+
+    def rollup(self, item, visiting):
+        totals = self.memo.get(item.item_number)
+        if totals is not None:
+            return totals
+        if item.item_number in visiting:
+            raise BOMCycleError(f"BOM cycle detected at {item.item_number}")
+        visiting.add(item.item_number)
+        self.watch(item)
+        if not item.bom.items:
+            totals = {item.item_number: 1}
+        else:
+            totals = {}
+            for number, child in item.bom.items.items():
+                self.parents.setdefault(number, set()).add(item.item_number)
+                qty = item.bom.quantities[number]
+                for leaf, count in self.rollup(child, visiting).items():
+                    totals[leaf] = totals.get(leaf, 0) + count * qty
+        visiting.discard(item.item_number)
+        self.memo[item.item_number] = totals
+        return totals
+
+    def watch(self, item):
+        # Held weakly by the BOM, so a discarded rollup is not kept alive by the items it watched
+        if item.item_number not in self.watched:
+            listener = weakref.WeakMethod(self.on_bom_changed)
+            self.watched[item.item_number] = (item.bom, listener)
+            item.bom.listeners.append(listener)
+
+    def close(self):
+        # Detaches from every watched BOM now rather than at their next change
+        for bom, listener in self.watched.values():
+            if listener in bom.listeners:
+                bom.listeners.remove(listener)
+        self.watched.clear()
+        self.memo.clear()
+        self.parents.clear()
+
+    def on_bom_changed(self, bom):
+        if bom.owner is not None:
+            self.invalidate(bom.owner.item_number)
+
+    def invalidate(self, item_number):
+        # An ancestor can only be memoized if its descendants are, so stop at the first miss
+        stack = [item_number]
+        while stack:
+            number = stack.pop()
+            if self.memo.pop(number, None) is not None:
+                stack.extend(self.parents.get(number, ()))
+
+# === Compact BOM Graph ===
+class CompactNode:
+    # Lightweight handle into a CompactBOMGraph; mirrors the BOM methods for one parent
+    __slots__ = ("graph", "index")
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def item_number(self):
+        return self.graph.ids[self.index]
+
+    def get_item(self, item_number):
+        child = self.graph.position.get(item_number)
+        if child is None or self.graph.find_link(self.index, child) is None:
+            return None
+        return CompactNode(self.graph, child)
+
+    def add_item(self, item, quantity=1):
+        self.graph.add_link(self.item_number, item if isinstance(item, str) else item.item_number, quantity)
+
+    def change_quantity(self, item_number, new_quantity):
+        child = self.graph.position.get(item_number)
+        if child is not None:
+            self.graph.set_quantity(self.index, child, new_quantity)
+
+    def children(self):
+        for child, qty in self.graph.child_links(self.index):
+            yield CompactNode(self.graph, child), qty
+
+    def parents(self):
+        return [CompactNode(self.graph, p) for p in self.graph.parent_indexes(self.index)]
+
+class CompactBOMGraph:
+    # Items are interned to dense integer ids. Links live in CSR arrays: the children
+    # of node i are child_index[child_offsets[i]:child_offsets[i + 1]] with matching
+    # quantities; parent_offsets/parent_index hold the reverse adjacency. Links added
+    # after the build go to a small overflow dict until compact() folds them in.
+    def __init__(self):
+        self.ids = []
+        self.position = {}
+        self.child_offsets = array("q", [0])
+        self.child_index = array("i")
+        self.quantities = array("q")
+        self.parent_offsets = array("q", [0])
+        self.parent_index = array("i")
+        self.extra = {}
+
+    @classmethod
+    def from_links(cls, links):
+        graph = cls()
+        parents, children, quantities = array("i"), array("i"), array("q")
+        for parent, child, qty in links:
+            parents.append(graph.intern(parent))
+            children.append(graph.intern(child))
+            quantities.append(qty)
+        graph.build(parents, children, quantities)
+        return graph
+
+    @classmethod
+    def from_database(cls):
+        cursor = db_pool.connect().execute("SELECT parent_item, child_item, quantity FROM bom_links")
+        return cls.from_links((row[0], row[1], row[2] or 0) for row in cursor)
+
+    def intern(self, item_number):
+        index = self.position.get(item_number)
+        if index is None:
+            index = len(self.ids)
+            item_number = sys.intern(item_number)
+            self.ids.append(item_number)
+            self.position[item_number] = index
+        return index
+
+    def build(self, parents, children, quantities):
+        # Counting sort by parent (and by child for the reverse arrays): O(nodes + links)
+        n = len(self.ids)
+        self.child_offsets, order = self.csr_order(parents, n)
+        self.child_index = array("i", (children[i] for i in order))
+        self.quantities = array("q", (quantities[i] for i in order))
+        self.parent_offsets, order = self.csr_order(children, n)
+        self.parent_index = array("i", (parents[i] for i in order))
+
+    @staticmethod
+    def csr_order(keys, n):
+        offsets = array("q", bytes(8 * (n + 1)))
+        for key in keys:
+            offsets[key + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        cursor = array("q", offsets[:n])
+        order = array("q", bytes(8 * len(keys)))
+        for i, key in enumerate(keys):
+            order[cursor[key]] = i
+            cursor[key] += 1
+        return offsets, order
+
+    def get_item(self, item_number):
+        index = self.position.get(item_number)
+        return CompactNode(self, index) if index is not None else None
+
+    def add_item(self, item_number):
+        return CompactNode(self, self.intern(item_number))
+
+    def add_link(self, parent, child, quantity=1):
+        parent_index, child_index = self.intern(parent), self.intern(child)
+        if self.find_link(parent_index, child_index) is not None:
+            self.set_quantity(parent_index, child_index, quantity)
+        else:
+            self.extra.setdefault(parent_index, {})[child_index] = quantity
+
+    def change_quantity(self, parent, child, new_quantity):
+        parent_index, child_index = self.position.get(parent), self.position.get(child)
+        if parent_index is not None and child_index is not None:
+            self.set_quantity(parent_index, child_index, new_quantity)
+
+    def csr_range(self, index):
+        if index + 1 < len(self.child_offsets):
+            return range(self.child_offsets[index], self.child_offsets[index + 1])
+        return range(0)
+
+    def find_link(self, parent, child):
+        for pos in self.csr_range(parent):
+            if self.child_index[pos] == child:
+                return pos
+        if child in self.extra.get(parent, ()):
+            return -1
+        return None
+
+    def set_quantity(self, parent, child, quantity):
+        pos = self.find_link(parent, child)
+        if pos == -1:
+            self.extra[parent][child] = quantity
+        elif pos is not None:
+            self.quantities[pos] = quantity
+
+    def child_links(self, index):
+        for pos in self.csr_range(index):
+            yield self.child_index[pos], self.quantities[pos]
+        yield from self.extra.get(index, {}).items()
+
+    def parent_indexes(self, index):
+        found = []
+        if index + 1 < len(self.parent_offsets):
+            found.extend(self.parent_index[self.parent_offsets[index]:self.parent_offsets[index + 1]])
+        found.extend(p for p, children in self.extra.items() if index in children)
+        return found
+
+    def compact(self):
+        if not self.extra:
+            return
+        parents, children, quantities = array("i"), array("i"), array("q")
+        for parent in range(len(self.ids)):
+            for child, qty in self.child_links(parent):
+                parents.append(parent)
+                children.append(child)
+                quantities.append(qty)
+        self.extra = {}
+        self.build(parents, children, quantities)
+
+    def link_count(self):
+        return len(self.child_index) + sum(len(children) for children in self.extra.values())
+
+# === Item Repository ===
+class LazyItem(Item):
+    # An Item read from the database: no number allocation, and its BOM and
+    # upper level are only fetched when first touched.
+    def __init__(self, repository, item_number, revision="A", upper_level_number=None, state="Draft"):
+        self.repository = repository
+        self.item_number = item_number
+        self.revision = revision
+        self.upper_level_number = upper_level_number
+        self.state = state
+        self._upper_level = None
+        self._bom = None
+
+    @property
+    def bom(self):
+        if self._bom is None:
+            self._bom = self.repository.load_bom(self)
+        return self._bom
+
+    @property
+    def upper_level(self):
+        if self._upper_level is None and self.upper_level_number:
+            self._upper_level = self.repository.get(self.upper_level_number)
+        return self._upper_level
+
+    @upper_level.setter
+    def upper_level(self, item):
+        self._upper_level = item
+        self.upper_level_number = item.item_number if item else None
+
+    def is_bom_loaded(self):
+        return self._bom is not None
+
+class ItemRepository:
+    # Identity map: one object per item_number for the lifetime of the repository
+    def __init__(self):
+        self.identity_map = {}
 
+    def get(self, item_number):
+        item = self.identity_map.get(item_number)
+        if item is None:
+            item = self.get_many([item_number]).get(item_number)
+        return item
+
+    def get_many(self, item_numbers):
+        found = {n: self.identity_map[n] for n in item_numbers if n in self.identity_map}
+        missing = [n for n in dict.fromkeys(item_numbers) if n not in found]
+        conn = db_pool.connect()
+        for i in range(0, len(missing), 900):
+            batch = missing[i:i + 900]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT item_number, revision, upper_level, state FROM items "
+                                f"WHERE item_number IN ({placeholders})", batch)
+            for row in rows:
+                found[row[0]] = self.register(LazyItem(self, row[0], row[1], row[2], row[3] or "Draft"))
+        return found
+
+    def register(self, item):
+        return self.identity_map.setdefault(item.item_number, item)
+
+    def load_bom(self, item):
+        bom = BOM(item)
+        links = db_pool.connect().execute("SELECT child_item, quantity FROM bom_links WHERE parent_item = ?",
+                                          (item.item_number,)).fetchall()
+        children = self.get_many([row[0] for row in links])
+        for child_number, qty in links:
+            # A link to an item with no items row still shows up, as a Draft placeholder
+            child = children.get(child_number) or self.register(LazyItem(self, child_number, None, item.item_number))
+            bom.items[child_number] = child
+            bom.quantities[child_number] = qty
+        return bom
+
+    def clear(self):
+        self.identity_map.clear()
+
+@instrumented(rows=lambda result: 1)
 def add_item_to_db(item):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO items (item_number, revision, upper_level, state) VALUES (?, ?, ?, ?)",
-                       (item.item_number, "A", item.upper_level.item_number if item.upper_level else None, item.state))
-        conn.commit()
+        with db_pool.transaction() as conn:
+            conn.execute("INSERT INTO items (item_number, revision, upper_level, state) VALUES (?, ?, ?, ?)",
+                         (item.item_number, "A", item.upper_level.item_number if item.upper_level else None, item.state))
+        item_state_cache.put(item.item_number, item.state)
     except Exception as e:
-        logging.error(f"DB Error: {e}")
+        metrics.record_error("add_item_to_db")
+        logger.error("DB Error: %s", e, extra={"operation": "add_item", "item_number": item.item_number})
 
+@instrumented(rows=lambda result: 1)
 def add_change_request_to_db(cr):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO change_requests (change_request_number, item_number, reason, cost_impact, timeline_impact, status) VALUES (?, ?, ?, ?, ?, ?)",
-                       (cr.change_request_number, cr.item.item_number, cr.reason, cr.cost_impact, cr.timeline_impact, cr.status))
-        conn.commit()
+        with db_pool.transaction() as conn:
+            conn.execute("INSERT INTO change_requests (change_request_number, item_number, reason, cost_impact, timeline_impact, status) VALUES (?, ?, ?, ?, ?, ?)",
+                         (cr.change_request_number, cr.item.item_number, cr.reason, cr.cost_impact, cr.timeline_impact, cr.status))
     except Exception as e:
-        logging.error(f"CR DB Error: {e}")
+        metrics.record_error("add_change_request_to_db")
+        logger.error("CR DB Error: %s", e, extra={"operation": "add_change_request", "item_number": cr.item.item_number})
 
+# Re-linking an existing parent/child pair replaces its quantity, as BOM.add_item does
+UPSERT_BOM_LINK = (
+    "INSERT INTO bom_links (parent_item, child_item, quantity) VALUES (?, ?, ?) "
+    "ON CONFLICT (parent_item, child_item) DO UPDATE SET quantity = excluded.quantity"
+)
+
+@instrumented()
+def rebuild_bom_closure():
+    with db_pool.transaction() as conn:
+        conn.execute("DELETE FROM bom_closure")
+        conn.execute('''
+            WITH RECURSIVE reach (ancestor, descendant) AS (
+                SELECT parent_item, child_item FROM bom_links
+                UNION
+                SELECT r.ancestor, b.child_item FROM reach r JOIN bom_links b ON b.parent_item = r.descendant
+            )
+            INSERT INTO bom_closure (ancestor, descendant) SELECT ancestor, descendant FROM reach
+        ''')
+
+def creates_cycle(conn, parent_item, child_item):
+    if parent_item == child_item:
+        return True
+    row = conn.execute("SELECT 1 FROM bom_closure WHERE ancestor = ? AND descendant = ?", (child_item, parent_item))
+    return row.fetchone() is not None
+
+@instrumented(rows=lambda result: 1)
 def add_bom_link_to_db(parent_item, child_item, quantity):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO bom_links (parent_item, child_item, quantity) VALUES (?, ?, ?)",
-                       (parent_item, child_item, quantity))
-        conn.commit()
+        with db_pool.transaction() as conn:
+            if creates_cycle(conn, parent_item, child_item):
+                raise BOMCycleError(f"Cannot link {child_item} under {parent_item}: {parent_item} would become its own descendant")
+            conn.execute(UPSERT_BOM_LINK, (parent_item, child_item, quantity))
+    except BOMCycleError as e:
+        logger.error("BOM Link DB Error: %s", e, extra={"operation": "add_bom_link", "item_number": parent_item})
+        raise
     except Exception as e:
-        logging.error(f"BOM Link DB Error: {e}")
+        metrics.record_error("add_bom_link_to_db")
+        logger.error("BOM Link DB Error: %s", e, extra={"operation": "add_bom_link", "item_number": parent_item})
 
+@instrumented()
 def load_bom_links(bom):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = db_pool.connect().cursor()
     cursor.execute("SELECT * FROM bom_links")
     links = cursor.fetchall()
 
@@ -151,25 +1337,1481 @@ def load_bom_links(bom):
             parent.bom.add_item(child, qty)
             child.upper_level = parent
 
+# === BOM Explosion ===
+BOMNode = namedtuple("BOMNode", "item_number parent_item level quantity total_quantity path")
+
+PATH_SEPARATOR = "/"
+
+# ORDER BY level DESC makes SQLite pop the deepest queued row first, so rows
+# come out depth-first and are produced incrementally instead of sorted at the end.
+# The instr() guard stops the walk if the stored structure contains a cycle.
+EXPLODE_BOM_TEMPLATE = '''
+    WITH RECURSIVE explosion (item_number, parent_item, level, quantity, total_quantity, path) AS (
+        SELECT child_item, parent_item, 1, quantity, quantity, parent_item || :sep || child_item
+        FROM {links} WHERE parent_item = :root {filter}
+        UNION ALL
+        SELECT b.child_item, b.parent_item, e.level + 1, b.quantity, e.total_quantity * b.quantity,
+               e.path || :sep || b.child_item
+        FROM explosion e JOIN {links} b ON b.parent_item = e.item_number {filter}
+        WHERE (:max_depth IS NULL OR e.level < :max_depth)
+          AND instr(:sep || e.path || :sep, :sep || b.child_item || :sep) = 0
+        ORDER BY 3 DESC
+    )
+    SELECT item_number, parent_item, level, quantity, total_quantity, path FROM explosion
+'''
+EXPLODE_BOM_SQL = EXPLODE_BOM_TEMPLATE.format(links="bom_links", filter="")
+
+@instrumented()
+def explode_bom(root_item_number, max_depth=None):
+    # Yields a BOMNode per occurrence below the root; total_quantity is the
+    # product of quantities along the path, i.e. how many go into one root.
+    cursor = db_pool.connect().execute(EXPLODE_BOM_SQL, {"root": root_item_number, "max_depth": max_depth,
+                                                         "sep": PATH_SEPARATOR})
+    for row in cursor:
+        yield BOMNode(row[0], row[1], row[2], row[3], row[4], tuple(row[5].split(PATH_SEPARATOR)))
+
+# === Revision History ===
+EXPLODE_BOM_AS_OF_SQL = EXPLODE_BOM_TEMPLATE.format(
+    links="bom_link_history", filter="AND effective_to > :as_of AND effective_from <= :as_of")
+
+def as_of_timestamp(as_of):
+    # Aware datetimes are converted to UTC, naive ones are taken as UTC; strings are
+    # compared as ISO-8601, so "2025-04-01" means midnight UTC
+    if hasattr(as_of, "strftime"):
+        if getattr(as_of, "tzinfo", None) is not None:
+            as_of = as_of.astimezone(timezone.utc)
+        return as_of.strftime("%Y-%m-%dT%H:%M:%S.%f")[:23]
+    return str(as_of)
+
+@instrumented(rows=len)
+def get_bom_as_of(parent_item, as_of):
+    rows = db_pool.connect().execute('''
+        SELECT child_item, quantity FROM bom_link_history
+        WHERE parent_item = ? AND effective_to > ? AND effective_from <= ?
+    ''', (parent_item, as_of_timestamp(as_of), as_of_timestamp(as_of)))
+    return {row[0]: row[1] for row in rows}
+
+@instrumented()
+def explode_bom_as_of(root_item_number, as_of, max_depth=None):
+    cursor = db_pool.connect().execute(EXPLODE_BOM_AS_OF_SQL, {"root": root_item_number, "max_depth": max_depth,
+                                                               "sep": PATH_SEPARATOR, "as_of": as_of_timestamp(as_of)})
+    for row in cursor:
+        yield BOMNode(row[0], row[1], row[2], row[3], row[4], tuple(row[5].split(PATH_SEPARATOR)))
+
+@instrumented()
+def get_item_as_of(item_number, as_of):
+    row = db_pool.connect().execute('''
+        SELECT revision, state FROM item_history
+        WHERE item_number = ? AND effective_to > ? AND effective_from <= ?
+    ''', (item_number, as_of_timestamp(as_of), as_of_timestamp(as_of))).fetchone()
+    return {"item_number": item_number, "revision": row[0], "state": row[1]} if row else None
+
+@instrumented(rows=len)
+def get_item_history(item_number):
+    rows = db_pool.connect().execute(
+        "SELECT revision, state, effective_from, effective_to FROM item_history WHERE item_number = ? ORDER BY effective_from",
+        (item_number,))
+    return [dict(row) for row in rows]
+
+def next_revision(revision):
+    # A, B, ... Z, AA, AB, ...
+    letters = list(revision or "A")
+    i = len(letters) - 1
+    while i >= 0:
+        if letters[i] != "Z":
+            letters[i] = chr(ord(letters[i]) + 1)
+            return "".join(letters)
+        letters[i] = "A"
+        i -= 1
+    return "A" + "".join(letters)
+
+@instrumented(rows=lambda result: 1)
+def revise_item(item_number, new_revision=None):
+    with db_pool.transaction() as conn:
+        row = conn.execute("SELECT revision FROM items WHERE item_number = ?", (item_number,)).fetchone()
+        if row is None:
+            raise KeyError(item_number)
+        new_revision = new_revision or next_revision(row[0])
+        conn.execute("UPDATE items SET revision = ? WHERE item_number = ?", (new_revision, item_number))
+    logger.info("Revised %s from %s to %s", item_number, row[0], new_revision,
+                extra={"operation": "revise_item", "item_number": item_number})
+    return new_revision
+
+# === Baselines ===
+# Same baseline kinds as the CM plan generator (cm-plan.py BASELINE_TYPES)
+BASELINE_TYPES = ("Development", "Integration", "Release", "Production")
+
+def changed_items_since(conn, since, until=EFFECTIVE_FOREVER):
+    # Items whose revision/state or direct BOM lines changed between `since` and
+    # `until`, plus every assembly above them: exactly the nodes whose hash may differ.
+    rows = conn.execute(f'''
+        SELECT item_number FROM item_history WHERE effective_from BETWEEN :since AND :until
+        UNION SELECT item_number FROM item_history
+            WHERE effective_to BETWEEN :since AND :until AND effective_to < '{EFFECTIVE_FOREVER}'
+        UNION SELECT parent_item FROM bom_link_history WHERE effective_from BETWEEN :since AND :until
+        UNION SELECT parent_item FROM bom_link_history
+            WHERE effective_to BETWEEN :since AND :until AND effective_to < '{EFFECTIVE_FOREVER}'
+    ''', {"since": since, "until": until})
+    changed = {row[0] for row in rows}
+    if changed:
+        # Walk up the links valid at either end of the window rather than the live
+        # closure: an assembly may have held a changed item at `since` and lost it
+        # before now.
+        rows = conn.execute(f'''
+            WITH RECURSIVE up (item) AS (
+                SELECT value FROM json_each(:changed)
+                UNION
+                SELECT h.parent_item FROM bom_link_history h JOIN up ON h.child_item = up.item
+                WHERE (h.effective_from <= :since AND h.effective_to > :since)
+                   OR (h.effective_from <= :until AND (h.effective_to > :until OR h.effective_to = '{EFFECTIVE_FOREVER}'))
+            )
+            SELECT item FROM up
+        ''', {"changed": json.dumps(list(changed)), "since": since, "until": until})
+        changed.update(row[0] for row in rows)
+    return changed
+
+class BaselineBuilder:
+    def __init__(self, conn, root_item, dirty=None):
+        self.conn = conn
+        self.dirty = dirty
+        self.memo = {}
+        self.nodes_added = 0
+        self.nodes_reused = 0
+        # Prefetch the structure we expect to hash: the whole product on a first
+        # baseline, only the changed items afterwards. Anything else is fetched on demand.
+        targets = list(dirty) if dirty is not None else None
+        if targets is None:
+            targets = [root_item] + [row[0] for row in conn.execute(
+                "SELECT descendant FROM bom_closure WHERE ancestor = ?", (root_item,))]
+        self.revisions = {}
+        self.children = {item: [] for item in targets}
+        param = (json.dumps(targets),)
+        for item, revision in conn.execute(
+                "SELECT item_number, revision FROM items WHERE item_number IN (SELECT value FROM json_each(?))", param):
+            self.revisions[item] = revision
+        for parent, child, qty in conn.execute(
+                "SELECT parent_item, child_item, quantity FROM bom_links WHERE parent_item IN (SELECT value FROM json_each(?))",
+                param):
+            self.children[parent].append((child, qty))
+
+    def load(self, item):
+        if item not in self.children:
+            row = self.conn.execute("SELECT revision FROM items WHERE item_number = ?", (item,)).fetchone()
+            self.revisions[item] = row[0] if row else None
+            self.children[item] = [tuple(r) for r in self.conn.execute(
+                "SELECT child_item, quantity FROM bom_links WHERE parent_item = ?", (item,))]
+        return self.revisions.get(item), sorted(self.children[item])
+
+    def hash_item(self, item, previous_hash=None):
+        if item in self.memo:
+            return self.memo[item]
+        if previous_hash is not None and self.dirty is not None and item not in self.dirty:
+            self.nodes_reused += 1
+            self.memo[item] = previous_hash
+            return previous_hash
+        previous_children = {}
+        if previous_hash is not None:
+            previous_children = {c: h for c, q, h in load_baseline_node(self.conn, previous_hash)["children"]}
+        revision, links = self.load(item)
+        children = [[child, qty, self.hash_item(child, previous_children.get(child))] for child, qty in links]
+        encoded = json.dumps(children, separators=(",", ":"))
+        digest = hashlib.blake2b(json.dumps([item, revision]).encode() + encoded.encode(), digest_size=16).hexdigest()
+        cursor = self.conn.execute("INSERT OR IGNORE INTO baseline_nodes (hash, item_number, revision, children) VALUES (?, ?, ?, ?)",
+                                   (digest, item, revision, encoded))
+        self.nodes_added += cursor.rowcount
+        self.memo[item] = digest
+        return digest
+
+def load_baseline_node(conn, node_hash):
+    row = conn.execute("SELECT item_number, revision, children FROM baseline_nodes WHERE hash = ?", (node_hash,)).fetchone()
+    return {"hash": node_hash, "item_number": row[0], "revision": row[1], "children": json.loads(row[2])}
+
+@instrumented()
+def get_baseline(name):
+    row = db_pool.connect().execute("SELECT * FROM baselines WHERE name = ?", (name,)).fetchone()
+    return dict(row) if row else None
+
+@instrumented(rows=len)
+def list_baselines(root_item=None):
+    conn = db_pool.connect()
+    if root_item is None:
+        rows = conn.execute("SELECT * FROM baselines ORDER BY created_at")
+    else:
+        rows = conn.execute("SELECT * FROM baselines WHERE root_item = ? ORDER BY created_at", (root_item,))
+    return [dict(row) for row in rows]
+
+@instrumented(rows=lambda result: result["nodes_added"])
+def create_baseline(name, root_item, baseline_type="Development", previous=None):
+    # Freezes root_item's configuration. Deltas are taken against `previous`, or by
+    # default the latest baseline of the same root; only items changed since then
+    # (and their ancestors) are re-read and re-hashed.
+    if baseline_type not in BASELINE_TYPES:
+        raise ValueError(f"Unknown baseline type: {baseline_type}")
+    start = time.perf_counter()
+    with db_pool.transaction() as conn:
+        if conn.execute("SELECT 1 FROM baselines WHERE name = ?", (name,)).fetchone():
+            raise ValueError(f"Baseline {name} already exists")
+        created_at = conn.execute(f"SELECT {NOW_SQL}").fetchone()[0]
+        if previous is None:
+            prev = conn.execute("SELECT * FROM baselines WHERE root_item = ? ORDER BY created_at DESC LIMIT 1",
+                                (root_item,)).fetchone()
+        else:
+            prev = conn.execute("SELECT * FROM baselines WHERE name = ?", (previous,)).fetchone()
+            if prev is None:
+                raise KeyError(previous)
+        if prev is not None and prev["root_item"] == root_item:
+            builder = BaselineBuilder(conn, root_item, changed_items_since(conn, prev["created_at"]))
+            root_hash = builder.hash_item(root_item, prev["root_hash"])
+        else:
+            builder = BaselineBuilder(conn, root_item)
+            root_hash = builder.hash_item(root_item)
+        conn.execute("INSERT INTO baselines (name, baseline_type, root_item, root_hash, previous, created_at, nodes_added) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (name, baseline_type, root_item, root_hash, prev["name"] if prev else None, created_at, builder.nodes_added))
+    elapsed = time.perf_counter() - start
+    logger.info("Baseline %s of %s: %s new nodes, %s reused", name, root_item, builder.nodes_added, builder.nodes_reused,
+                extra={"operation": "create_baseline", "item_number": root_item, "duration_ms": round(elapsed * 1000, 3),
+                       "rows": builder.nodes_added})
+    return {"name": name, "root_hash": root_hash, "nodes_added": builder.nodes_added,
+            "nodes_reused": builder.nodes_reused, "seconds": round(elapsed, 4)}
+
+@instrumented()
+def baseline_links(name):
+    # Yields (parent_item, parent_revision, child_item, quantity) once per distinct node in the baseline
+    baseline = get_baseline(name)
+    if baseline is None:
+        raise KeyError(name)
+    conn = db_pool.connect()
+    seen = set()
+    stack = [baseline["root_hash"]]
+    while stack:
+        node_hash = stack.pop()
+        if node_hash in seen:
+            continue
+        seen.add(node_hash)
+        node = load_baseline_node(conn, node_hash)
+        for child, qty, child_hash in node["children"]:
+            yield node["item_number"], node["revision"], child, qty
+            stack.append(child_hash)
+
+# === BOM Diff ===
+BOMDiffLine = namedtuple("BOMDiffLine", "change level path item_number old_quantity new_quantity old_revision new_revision")
+
+def diff_structures(left_root, right_root, left_children, right_children, same, root_path=None):
+    # Depth-first diff of two structures. *_children(handle) returns
+    # {item_number: (quantity, revision, child_handle)}; same(left, right) says two
+    # matched subtrees are known identical, so they are skipped without being read.
+    # Added and removed lines are reported once, not expanded.
+    stack = [(left_root, right_root, 1, root_path or ())]
+    while stack:
+        left, right, level, path = stack.pop()
+        old, new = left_children(left), right_children(right)
+        for item in sorted(old.keys() | new.keys(), reverse=True):
+            if item not in new:
+                yield BOMDiffLine("removed", level, path, item, old[item][0], None, old[item][1], None)
+            elif item not in old:
+                yield BOMDiffLine("added", level, path, item, None, new[item][0], None, new[item][1])
+            else:
+                (old_qty, old_rev, old_handle), (new_qty, new_rev, new_handle) = old[item], new[item]
+                if old_qty != new_qty:
+                    yield BOMDiffLine("quantity", level, path, item, old_qty, new_qty, old_rev, new_rev)
+                if old_rev != new_rev:
+                    yield BOMDiffLine("revision", level, path, item, old_qty, new_qty, old_rev, new_rev)
+                if not same(old_handle, new_handle):
+                    stack.append((old_handle, new_handle, level + 1, path + (item,)))
+
+def live_children(conn):
+    def children(item_number):
+        rows = conn.execute('''
+            SELECT b.child_item, b.quantity, i.revision FROM bom_links b
+            LEFT JOIN items i ON i.item_number = b.child_item WHERE b.parent_item = ?
+        ''', (item_number,))
+        return {row[0]: (row[1], row[2], row[0]) for row in rows}
+    return children
+
+def as_of_children(conn, as_of):
+    as_of = as_of_timestamp(as_of)
+    def children(item_number):
+        rows = conn.execute('''
+            SELECT b.child_item, b.quantity, h.revision FROM bom_link_history b
+            LEFT JOIN item_history h ON h.item_number = b.child_item AND h.effective_to > :t AND h.effective_from <= :t
+            WHERE b.parent_item = :item AND b.effective_to > :t AND b.effective_from <= :t
+        ''', {"item": item_number, "t": as_of})
+        return {row[0]: (row[1], row[2], row[0]) for row in rows}
+    return children
+
+def baseline_children(conn):
+    def children(node_hash):
+        node = load_baseline_node(conn, node_hash)
+        rows = conn.execute("SELECT hash, revision FROM baseline_nodes WHERE hash IN (SELECT value FROM json_each(?))",
+                            (json.dumps([child_hash for _, _, child_hash in node["children"]]),))
+        revisions = dict((row[0], row[1]) for row in rows)
+        return {child: (qty, revisions.get(child_hash), child_hash) for child, qty, child_hash in node["children"]}
+    return children
+
+@instrumented()
+def diff_items(left_item, right_item):
+    # Two live assemblies: a child item present under both is the same subtree
+    conn = db_pool.connect()
+    children = live_children(conn)
+    return diff_structures(left_item, right_item, children, children, lambda a, b: a == b)
+
+@instrumented()
+def diff_as_of(item_number, before, after=None):
+    # One assembly at two points in time (after=None means now). Subtrees with no
+    # recorded change in between are skipped using the revision history.
+    conn = db_pool.connect()
+    before = as_of_timestamp(before)
+    after = as_of_timestamp(after) if after is not None else conn.execute(f"SELECT {NOW_SQL}").fetchone()[0]
+    changed = changed_items_since(conn, before, after)
+    return diff_structures(item_number, item_number, as_of_children(conn, before), as_of_children(conn, after),
+                           lambda a, b: a == b and a not in changed)
+
+@instrumented()
+def diff_baselines(left_name, right_name):
+    left, right = get_baseline(left_name), get_baseline(right_name)
+    if left is None or right is None:
+        raise KeyError(left_name if left is None else right_name)
+    children = baseline_children(db_pool.connect())
+    return diff_structures(left["root_hash"], right["root_hash"], children, children, lambda a, b: a == b)
+
+# === Where-Used ===
+WhereUsedNode = namedtuple("WhereUsedNode", "item_number child_item level quantity total_quantity path")
+
+# Mirror of EXPLODE_BOM_SQL walking child -> parent over idx_bom_links_child.
+# path runs from the queried item up to item_number.
+WHERE_USED_SQL = '''
+    WITH RECURSIVE usage (item_number, child_item, level, quantity, total_quantity, path) AS (
+        SELECT parent_item, child_item, 1, quantity, quantity, child_item || :sep || parent_item
+        FROM bom_links WHERE child_item = :item
+        UNION ALL
+        SELECT b.parent_item, b.child_item, u.level + 1, b.quantity, u.total_quantity * b.quantity,
+               u.path || :sep || b.parent_item
+        FROM usage u JOIN bom_links b ON b.child_item = u.item_number
+        WHERE (:max_depth IS NULL OR u.level < :max_depth)
+          AND instr(:sep || u.path || :sep, :sep || b.parent_item || :sep) = 0
+        ORDER BY 3 DESC
+    )
+    SELECT item_number, child_item, level, quantity, total_quantity, path FROM usage
+'''
+
+@instrumented()
+def where_used(item_number, max_depth=None):
+    # Yields every assembly path that consumes item_number; total_quantity is how
+    # many of item_number one unit of that assembly needs along that path.
+    cursor = db_pool.connect().execute(WHERE_USED_SQL, {"item": item_number, "max_depth": max_depth,
+                                                        "sep": PATH_SEPARATOR})
+    for row in cursor:
+        yield WhereUsedNode(row[0], row[1], row[2], row[3], row[4], tuple(row[5].split(PATH_SEPARATOR)))
+
+@instrumented(rows=len)
+def get_ancestor_items(item_number, conn=None):
+    rows = (conn or db_pool.connect()).execute("SELECT ancestor FROM bom_closure WHERE descendant = ?", (item_number,))
+    return {row[0] for row in rows}
+
+@instrumented(rows=len)
+def get_descendant_items(item_number, conn=None):
+    rows = (conn or db_pool.connect()).execute("SELECT descendant FROM bom_closure WHERE ancestor = ?", (item_number,))
+    return {row[0] for row in rows}
+
+@instrumented(rows=len)
+def get_top_level_items(item_number, conn=None):
+    # Top-level products affected by a change to item_number: ancestors nothing else consumes
+    rows = (conn or db_pool.connect()).execute('''
+        SELECT c.ancestor FROM bom_closure c
+        WHERE c.descendant = ?
+          AND NOT EXISTS (SELECT 1 FROM bom_links b WHERE b.child_item = c.ancestor)
+    ''', (item_number,))
+    return {row[0] for row in rows}
+
+# === Item State Cache ===
+class TTLCache:
+    # Bounded LRU; entries also expire ttl seconds after they were written, which
+    # bounds staleness from writers in other processes.
+    MISSING = object()
+
+    def __init__(self, maxsize=10000, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return self.MISSING
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 3) if total else None}
+
+item_state_cache = TTLCache()
+
+@instrumented()
 def get_item_state(item_id):
+    state = item_state_cache.get(item_id)
+    if state is not TTLCache.MISSING:
+        return state
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = db_pool.connect().cursor()
         cursor.execute("SELECT state FROM items WHERE item_number = ?", (item_id,))
         result = cursor.fetchone()
-        return result["state"] if result else "Draft"
+        state = result["state"] if result else "Draft"
+        item_state_cache.put(item_id, state)
+        return state
     except Exception as e:
-        logging.error(f"Get State Error: {e}")
+        metrics.record_error("get_item_state")
+        logger.error("Get State Error: %s", e, extra={"operation": "get_item_state", "item_number": item_id})
         return "Draft"
 
+@instrumented(rows=len)
+def get_item_states(item_ids):
+    # Cached states plus a single query for the rest; the id list travels as one
+    # JSON parameter, so there is no bound-variable limit on the batch size.
+    states = {}
+    missing = []
+    for item_id in dict.fromkeys(item_ids):
+        state = item_state_cache.get(item_id)
+        if state is TTLCache.MISSING:
+            missing.append(item_id)
+        else:
+            states[item_id] = state
+    if not missing:
+        return states
+    try:
+        rows = db_pool.connect().execute(
+            "SELECT item_number, state FROM items WHERE item_number IN (SELECT value FROM json_each(?))",
+            (json.dumps(missing),))
+        found = dict((row[0], row[1]) for row in rows)
+    except Exception as e:
+        metrics.record_error("get_item_states")
+        logger.error("Get States Error: %s", e, extra={"operation": "get_item_states", "rows": len(missing)})
+        states.update((item_id, "Draft") for item_id in missing)
+        return states
+    for item_id in missing:
+        states[item_id] = found.get(item_id) or "Draft"
+        item_state_cache.put(item_id, states[item_id])
+    return states
+
+@instrumented()
 def update_item_state(item_id, new_state):
+    # A single-item lifecycle transition, under the same rules and guards as transition_items
+    if new_state not in LIFECYCLE_TRANSITIONS:
+        logger.error("Update State Error: unknown state %r", new_state,
+                     extra={"operation": "update_item_state", "item_number": item_id})
+        return False
+    try:
+        result = transition_items([item_id], new_state)["results"][0]
+    except Exception as e:
+        metrics.record_error("update_item_state")
+        logger.error("Update State Error: %s", e, extra={"operation": "update_item_state", "item_number": item_id})
+        return False
+    if not result.ok:
+        item_state_cache.invalidate(item_id)
+        logger.warning("Update State rejected for %s: %s", item_id, result.message,
+                       extra={"operation": "update_item_state", "item_number": item_id})
+        return False
+    logger.info("Updated state for %s to %s", item_id, new_state,
+                extra={"operation": "update_item_state", "item_number": item_id, "rows": int(result.message == "updated")})
+    return True
+
+# === Lifecycle ===
+LIFECYCLE_TRANSITIONS = {
+    "Draft": ("In Review",),
+    "In Review": ("Released",),
+    "Released": ("Obsolete",),
+    "Obsolete": (),
+}
+
+TransitionResult = namedtuple("TransitionResult", "item_number from_state to_state ok message")
+
+def children_released_guard(conn, candidates, to_state, accepted):
+    # An assembly can only be released once everything it uses is released (or is
+    # accepted for release in the same call). Checks every candidate in one query
+    # and returns {item_number: reason} for the ones it blocks.
+    if to_state != "Released":
+        return {}
+    rows = conn.execute('''
+        SELECT b.parent_item, b.child_item, i.state FROM bom_links b LEFT JOIN items i ON i.item_number = b.child_item
+        WHERE b.parent_item IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(list(candidates)),))
+    blocked = {}
+    for parent, child, state in rows:
+        if state != "Released" and child not in accepted:
+            blocked.setdefault(parent, []).append(child)
+    return {parent: f"unreleased children: {', '.join(sorted(children)[:5])}{' ...' if len(children) > 5 else ''}"
+            for parent, children in blocked.items()}
+
+LIFECYCLE_GUARDS = [children_released_guard]
+
+def can_transition(from_state, to_state):
+    return to_state in LIFECYCLE_TRANSITIONS.get(from_state, ())
+
+@instrumented(rows=lambda result: result["updated"])
+def transition_items(item_ids, to_state, include_bom=False, atomic=True, guards=None):
+    # Moves items (and with include_bom their whole BOM subtree) to to_state in one
+    # transaction. Items already in to_state are reported ok and left alone. With
+    # atomic=True nothing is written if any item is rejected.
+    if to_state not in LIFECYCLE_TRANSITIONS:
+        raise ValueError(f"Unknown lifecycle state: {to_state}")
+    guards = LIFECYCLE_GUARDS if guards is None else guards
+    start = time.perf_counter()
+    with db_pool.transaction() as conn:
+        targets = dict.fromkeys(item_ids)
+        if include_bom:
+            rows = conn.execute("SELECT DISTINCT descendant FROM bom_closure WHERE ancestor IN (SELECT value FROM json_each(?))",
+                                (json.dumps(list(targets)),))
+            targets.update(dict.fromkeys(row[0] for row in rows))
+        targets = list(targets)
+        rows = conn.execute("SELECT item_number, state FROM items WHERE item_number IN (SELECT value FROM json_each(?))",
+                            (json.dumps(targets),))
+        current = dict((row[0], row[1] or "Draft") for row in rows)
+        reasons = {}
+        candidates = {}
+        for item_number in targets:
+            from_state = current.get(item_number)
+            if from_state is None:
+                reasons[item_number] = "unknown item"
+            elif from_state != to_state and not can_transition(from_state, to_state):
+                reasons[item_number] = f"transition {from_state} -> {to_state} not allowed"
+            elif from_state != to_state:
+                candidates[item_number] = from_state
+        # Guards only see items that will really move; rejecting one can block
+        # another (a parent whose child was refused), so repeat until stable.
+        while candidates:
+            accepted = set(candidates)
+            rejected = {}
+            for guard in guards:
+                for item_number, reason in guard(conn, candidates, to_state, accepted).items():
+                    rejected.setdefault(item_number, reason)
+            if not rejected:
+                break
+            reasons.update(rejected)
+            for item_number in rejected:
+                del candidates[item_number]
+        results = []
+        for item_number in targets:
+            from_state = current.get(item_number)
+            if item_number in reasons:
+                results.append(TransitionResult(item_number, from_state, to_state, False, reasons[item_number]))
+            else:
+                results.append(TransitionResult(item_number, from_state, to_state, True,
+                                                "updated" if item_number in candidates else "unchanged"))
+        rejected = [r for r in results if not r.ok]
+        updates = list(candidates)
+        if atomic and rejected:
+            updates = []
+        conn.executemany("UPDATE items SET state = ? WHERE item_number = ?", [(to_state, n) for n in updates])
+    for item_number in updates:
+        item_state_cache.put(item_number, to_state)
+    elapsed = time.perf_counter() - start
+    logger.info("Lifecycle transition to %s: %s updated, %s rejected", to_state, len(updates), len(rejected),
+                extra={"operation": "transition_items", "duration_ms": round(elapsed * 1000, 3), "rows": len(updates)})
+    return {"results": results, "updated": len(updates), "rejected": len(rejected), "seconds": round(elapsed, 4)}
+
+# === Change Impact ===
+CLOSED_CR_STATUSES = ("Closed", "Completed", "Rejected", "Cancelled")
+
+impact_cache = TTLCache(maxsize=2048, ttl=3600.0)
+
+def get_bom_version(conn=None):
+    row = (conn or db_pool.connect()).execute("SELECT value FROM sequences WHERE name = 'bom_version'").fetchone()
+    return row[0] if row else 0
+
+def structural_impact(conn, item_number, bom_version):
+    # The where-used part only depends on the BOM structure, so it is cached per
+    # (item, bom_version); any link change bumps the version and retires old entries.
+    key = (db_pool.db_path, item_number, bom_version)
+    impact = impact_cache.get(key)
+    if impact is TTLCache.MISSING:
+        impact = {"affected_assemblies": sorted(get_ancestor_items(item_number, conn)),
+                  "top_level_items": sorted(get_top_level_items(item_number, conn)),
+                  "components": sorted(get_descendant_items(item_number, conn))}
+        impact_cache.put(key, impact)
+    return impact
+
+@instrumented()
+def analyze_change_impact(item_number, change_request_number=None, bom_version=None):
+    # Affected assemblies (every ancestor of the item), the top-level products among
+    # them, and other open change requests anywhere on that subtree. CR data is
+    # always read fresh; only the structural walk is cached.
+    conn = db_pool.connect()
+    bom_version = get_bom_version(conn) if bom_version is None else bom_version
+    impact = structural_impact(conn, item_number, bom_version)
+    scope = [item_number] + impact["affected_assemblies"] + impact["components"]
+    placeholders = ",".join("?" * len(CLOSED_CR_STATUSES))
+    rows = conn.execute(f'''
+        SELECT change_request_number, item_number, status, reason FROM change_requests
+        WHERE item_number IN (SELECT value FROM json_each(?)) AND COALESCE(status, '') NOT IN ({placeholders})
+        ORDER BY change_request_number
+    ''', (json.dumps(scope), *CLOSED_CR_STATUSES))
+    related = [dict(row) for row in rows if row[0] != change_request_number]
+    return {
+        "item_number": item_number,
+        "change_request_number": change_request_number,
+        "bom_version": bom_version,
+        "affected_assemblies": impact["affected_assemblies"],
+        "top_level_items": impact["top_level_items"],
+        "components": impact["components"],
+        "open_change_requests": related,
+    }
+
+@instrumented(rows=len)
+def analyze_open_change_requests():
+    # Dashboard helper: impact for every open CR against one consistent bom_version
+    conn = db_pool.connect()
+    bom_version = get_bom_version(conn)
+    placeholders = ",".join("?" * len(CLOSED_CR_STATUSES))
+    rows = conn.execute(f"SELECT change_request_number, item_number FROM change_requests "
+                        f"WHERE COALESCE(status, '') NOT IN ({placeholders}) ORDER BY change_request_number",
+                        CLOSED_CR_STATUSES).fetchall()
+    return [analyze_change_impact(item, number, bom_version) for number, item in rows]
+
+# === Change Events ===
+ChangeEvent = namedtuple("ChangeEvent", "seq table_name operation row_key payload created_at")
+
+@instrumented()
+def read_events(after_seq=0, limit=None, tables=None, conn=None):
+    conn = conn or db_pool.connect()
+    query = "SELECT seq, table_name, operation, row_key, payload, created_at FROM change_events WHERE seq > ?"
+    params = [after_seq]
+    if tables:
+        query += " AND table_name IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(tables)))
+    query += " ORDER BY seq"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    for row in conn.execute(query, params):
+        yield ChangeEvent(row[0], row[1], row[2], row[3], json.loads(row[4]) if row[4] else None, row[5])
+
+def project_events(events, state=None):
+    # Folds events into {table: {row_key: row}}; pass the previous state to apply increments
+    state = state if state is not None else {table: {} for table in EVENT_TABLES}
+    for event in events:
+        rows = state.setdefault(event.table_name, {})
+        if event.operation == "delete":
+            rows.pop(event.row_key, None)
+        else:
+            rows[event.row_key] = event.payload
+    return state
+
+@instrumented(rows=lambda result: sum(result.values()))
+def replay_events(target_path, until_seq=None):
+    # Rebuilds every EVENT_TABLES table into a fresh database file from the log alone
+    events = read_events()
+    if until_seq is not None:
+        events = (e for e in events if e.seq <= until_seq)
+    state = project_events(events)
+    target = sqlite3.connect(target_path)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE items SET state = ? WHERE item_number = ?", (new_state, item_id))
-        conn.commit()
-        logging.info(f"Updated state for {item_id} to {new_state}")
+        with target:
+            create_tables(target)
+            for table, (_, columns) in EVENT_TABLES.items():
+                # Later tables, and columns later migrations added to base tables
+                target.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+                existing = {row[1] for row in target.execute(f"PRAGMA table_info({table})")}
+                for column in columns:
+                    if column not in existing:
+                        target.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+                placeholders = ",".join("?" * len(columns))
+                target.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                                   [tuple(row[c] for c in columns) for row in state[table].values()])
+    finally:
+        target.close()
+    return {table: len(rows) for table, rows in state.items()}
+
+def watch_database(interval=1.0, stop=None):
+    # Yields once at the start and then whenever another connection has committed,
+    # checking every interval seconds until stop is set. PRAGMA data_version only
+    # changes on such commits, so an idle database costs one pragma per interval
+    # instead of a query.
+    conn = db_pool.connect()
+    data_version = None
+    while stop is None or not stop.is_set():
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != data_version:
+            data_version = version
+            yield version
+        if stop is not None:
+            stop.wait(interval)
+        else:
+            time.sleep(interval)
+
+class EventTail:
+    # Incremental consumer for other threads or processes: remembers the last seq
+    # it handed out and only ever reads newer events.
+    def __init__(self, after_seq=0, tables=None, batch_size=1000):
+        self.last_seq = after_seq
+        self.tables = tables
+        self.batch_size = batch_size
+
+    def poll(self):
+        events = list(read_events(self.last_seq, self.batch_size, self.tables))
+        if events:
+            self.last_seq = events[-1].seq
+        return events
+
+    def follow(self, interval=1.0, stop=None):
+        for _ in watch_database(interval, stop):
+            while True:
+                events = self.poll()
+                yield from events
+                if len(events) < self.batch_size:
+                    break
+
+# === Document Vault ===
+CHUNK_SIZE = 1 << 20
+
+def vault_path_for(db_path):
+    # plm_database.db keeps its blobs in plm_database_vault/ next to it
+    return os.path.splitext(db_path)[0] + "_vault"
+
+class DocumentVault:
+    # Content-addressed blob store. A blob is split into fixed-size chunks, each
+    # stored once under chunks/<hh>/<hash>; the blob's manifest (its size and chunk
+    # hashes in order) is stored under blobs/<hh>/<hash>, named by the hash of the
+    # whole content. Duplicate uploads and repeated chunks cost no extra space.
+    # Objects are written under a temporary name and renamed into place, so a
+    # crash never leaves a partial object behind a valid hash.
+    def __init__(self, root, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def path(self, kind, digest):
+        return os.path.join(self.root, kind, digest[:2], digest)
+
+    def write(self, kind, digest, data):
+        path = self.path(kind, digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+        return True
+
+    def put(self, source):
+        # source is a path or a binary file object; it is read one chunk at a time
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                return self.put(f)
+        whole = hashlib.blake2b(digest_size=32)
+        chunks = []
+        size = 0
+        while True:
+            data = source.read(self.chunk_size)
+            if not data:
+                break
+            whole.update(data)
+            digest = hashlib.blake2b(data, digest_size=32).hexdigest()
+            self.write("chunks", digest, data)
+            chunks.append(digest)
+            size += len(data)
+        digest = whole.hexdigest()
+        manifest = {"size": size, "chunk_size": self.chunk_size, "chunks": chunks}
+        self.write("blobs", digest, json.dumps(manifest).encode())
+        return digest, size
+
+    def exists(self, digest):
+        return os.path.exists(self.path("blobs", digest))
+
+    def manifest(self, digest):
+        with open(self.path("blobs", digest), "rb") as f:
+            return json.load(f)
+
+    def open(self, digest):
+        return io.BufferedReader(VaultReader(self, self.manifest(digest)), buffer_size=64 * 1024)
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def objects(self, kind):
+        base = os.path.join(self.root, kind)
+        if not os.path.isdir(base):
+            return
+        for prefix in os.listdir(base):
+            for name in os.listdir(os.path.join(base, prefix)):
+                if not name.endswith(".tmp"):
+                    yield os.path.join(base, prefix, name), name
+
+    def sweep(self, live):
+        # Deletes blobs not in `live` and chunks no live blob uses. Run it while no
+        # other process is storing documents: a concurrent put may be relying on a
+        # chunk that is about to be removed.
+        keep = set()
+        removed = 0
+        for path, digest in list(self.objects("blobs")):
+            if digest in live:
+                keep.update(self.manifest(digest)["chunks"])
+            else:
+                os.remove(path)
+                removed += 1
+        for path, digest in list(self.objects("chunks")):
+            if digest not in keep:
+                os.remove(path)
+                removed += 1
+        return removed
+
+class VaultReader(io.RawIOBase):
+    # Seekable, read-only view of one blob. Only the chunk under the cursor is
+    # memory-mapped, so a multi-hundred-MB drawing is never loaded as a whole.
+    def __init__(self, vault, manifest):
+        self.vault = vault
+        self.size = manifest["size"]
+        self.chunk_size = manifest["chunk_size"]
+        self.chunks = manifest["chunks"]
+        self.position = 0
+        self.index = None
+        self.mapped = None
+
+    def readable(self):
         return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self.position = offset
+        return offset
+
+    def map_chunk(self, index):
+        if index != self.index:
+            self.unmap()
+            with open(self.vault.path("chunks", self.chunks[index]), "rb") as f:
+                self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.index = index
+        return self.mapped
+
+    def unmap(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+            self.index = None
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        index, offset = divmod(self.position, self.chunk_size)
+        chunk = self.map_chunk(index)
+        count = min(len(buffer), len(chunk) - offset)
+        memoryview(buffer).cast("B")[:count] = chunk[offset:offset + count]
+        self.position += count
+        return count
+
+    def close(self):
+        self.unmap()
+        super().close()
+
+document_vault = DocumentVault(vault_path_for(DB_PATH))
+
+# === Document Versions ===
+# Bodies up to MAX_DELTA_BYTES are stored as a delta against the previous version,
+# with a full keyframe at least every KEYFRAME_INTERVAL versions; reading an old
+# version applies at most KEYFRAME_INTERVAL - 1 deltas. Larger bodies are always
+# stored whole and rely on the vault's chunk-level dedupe instead.
+KEYFRAME_INTERVAL = 32
+MAX_DELTA_BYTES = 16 * 1024 * 1024
+DELTA_COPY = ord("C")
+DELTA_INSERT = ord("I")
+
+def make_delta(base, target):
+    # Line-level copy/insert ops against base, zlib-compressed, in linear time: base
+    # lines are indexed by content, and each target line either continues the
+    # current copy or starts one at the first base line with the same content; a
+    # copy then extends for as long as the lines agree. Binary bodies split on b"\n"
+    # as well; when little lines up, the delta is large and the caller stores a
+    # keyframe instead.
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    offsets = [0, *accumulate(len(line) for line in base_lines)]
+    first = {}
+    for i, line in enumerate(base_lines):
+        first.setdefault(line, i)
+    ops = bytearray()
+    inserted = []
+    def flush_inserts():
+        if inserted:
+            data = b"".join(inserted)
+            ops.extend(struct.pack(">BQ", DELTA_INSERT, len(data)) + data)
+            inserted.clear()
+    following = 0
+    j = 0
+    while j < len(target_lines):
+        line = target_lines[j]
+        if following < len(base_lines) and base_lines[following] == line:
+            i = following
+        else:
+            i = first.get(line)
+        if i is None:
+            inserted.append(line)
+            j += 1
+            continue
+        start = i
+        while i < len(base_lines) and j < len(target_lines) and base_lines[i] == target_lines[j]:
+            i += 1
+            j += 1
+        flush_inserts()
+        ops += struct.pack(">BQQ", DELTA_COPY, offsets[start], offsets[i] - offsets[start])
+        following = i
+    flush_inserts()
+    return zlib.compress(bytes(ops))
+
+def apply_delta(base, delta):
+    ops = zlib.decompress(delta)
+    out = bytearray()
+    position = 0
+    while position < len(ops):
+        if ops[position] == DELTA_COPY:
+            offset, length = struct.unpack_from(">QQ", ops, position + 1)
+            out += base[offset:offset + length]
+            position += 17
+        else:
+            (length,) = struct.unpack_from(">Q", ops, position + 1)
+            out += ops[position + 9:position + 9 + length]
+            position += 9 + length
+    return bytes(out)
+
+@instrumented()
+def store_document(document_number, source, file_path=None):
+    # Streams source into the vault and records a new version when the body
+    # changed; re-uploading identical content is a no-op. The delta against the
+    # current version is computed before taking the write lock and only used if
+    # that version is still current once the lock is held.
+    content_hash, size = document_vault.put(source)
+    if file_path is None and isinstance(source, (str, os.PathLike)):
+        file_path = os.fspath(source)
+    head = get_document(document_number)
+    delta_hash = None
+    if (head is not None and head["content_hash"] not in (None, content_hash)
+            and max(size, head["size"] or 0) <= MAX_DELTA_BYTES):
+        delta = make_delta(document_vault.read(head["content_hash"]), document_vault.read(content_hash))
+        if len(delta) < size // 2:
+            delta_hash, _ = document_vault.put(io.BytesIO(delta))
+    with db_pool.transaction() as conn:
+        row = conn.execute("SELECT version, content_hash FROM documents WHERE document_number = ?",
+                           (document_number,)).fetchone()
+        if row is not None and row["content_hash"] == content_hash:
+            return get_document(document_number)
+        version = (row["version"] or 0) + 1 if row else 1
+        kind, base_version, chain, object_hash = "full", None, 0, content_hash
+        if delta_hash is not None and row["content_hash"] == head["content_hash"]:
+            previous = conn.execute("SELECT chain FROM document_versions WHERE document_number = ? AND version = ?",
+                                    (document_number, row["version"])).fetchone()
+            if previous is not None and previous["chain"] + 1 < KEYFRAME_INTERVAL:
+                kind, base_version, chain, object_hash = "delta", row["version"], previous["chain"] + 1, delta_hash
+        conn.execute(f'''
+            INSERT INTO documents (document_number, version, file_path, content_hash, size, stored_at)
+            VALUES (?, ?, ?, ?, ?, {NOW_SQL})
+            ON CONFLICT (document_number) DO UPDATE SET version = excluded.version,
+                file_path = COALESCE(excluded.file_path, file_path), content_hash = excluded.content_hash,
+                size = excluded.size, stored_at = excluded.stored_at
+        ''', (document_number, version, file_path, content_hash, size))
+        conn.execute(f'''
+            INSERT INTO document_versions (document_number, version, kind, base_version, chain,
+                                           content_hash, object_hash, size, file_path, stored_at)
+            SELECT document_number, version, ?, ?, ?, content_hash, ?, size, file_path, stored_at
+            FROM documents WHERE document_number = ?
+        ''', (kind, base_version, chain, object_hash, document_number))
+    logger.info("Stored %s version %s (%s bytes, %s)", document_number, version, size, kind,
+                extra={"operation": "store_document", "rows": 1})
+    return get_document(document_number)
+
+@instrumented()
+def get_document(document_number):
+    row = db_pool.connect().execute("SELECT * FROM documents WHERE document_number = ?", (document_number,)).fetchone()
+    return dict(row) if row else None
+
+@instrumented(rows=len)
+def list_documents():
+    return [dict(row) for row in db_pool.connect().execute("SELECT * FROM documents ORDER BY document_number")]
+
+@instrumented(rows=len)
+def list_document_versions(document_number):
+    return [dict(row) for row in db_pool.connect().execute(
+        "SELECT * FROM document_versions WHERE document_number = ? ORDER BY version", (document_number,))]
+
+@instrumented()
+def read_document_version(document_number, version):
+    # Walks base_version links back to the nearest full version, then applies the
+    # deltas forward; at most KEYFRAME_INTERVAL - 1 of them.
+    chain = db_pool.connect().execute('''
+        WITH RECURSIVE chain (version, kind, base_version, object_hash) AS (
+            SELECT version, kind, base_version, object_hash FROM document_versions
+            WHERE document_number = :document AND version = :version
+            UNION ALL
+            SELECT v.version, v.kind, v.base_version, v.object_hash
+            FROM chain c JOIN document_versions v ON v.document_number = :document AND v.version = c.base_version
+        )
+        SELECT kind, object_hash FROM chain
+    ''', {"document": document_number, "version": version}).fetchall()
+    if not chain:
+        raise KeyError((document_number, version))
+    content = document_vault.read(chain[-1]["object_hash"])
+    for row in reversed(chain[:-1]):
+        content = apply_delta(content, document_vault.read(row["object_hash"]))
+    return content
+
+@instrumented()
+def open_document(document_number, version=None):
+    # A seekable binary file object over the stored body; close it when done. The
+    # current version and full versions stream from the vault, delta versions are
+    # rebuilt in memory (they are at most MAX_DELTA_BYTES).
+    document = get_document(document_number)
+    if document is None or document["content_hash"] is None:
+        raise KeyError(document_number)
+    if version is None or version == document["version"]:
+        return document_vault.open(document["content_hash"])
+    row = db_pool.connect().execute("SELECT kind, object_hash FROM document_versions "
+                                    "WHERE document_number = ? AND version = ?", (document_number, version)).fetchone()
+    if row is None:
+        raise KeyError((document_number, version))
+    if row["kind"] == "full":
+        return document_vault.open(row["object_hash"])
+    return io.BytesIO(read_document_version(document_number, version))
+
+@instrumented()
+def export_document(document_number, destination, version=None):
+    with open_document(document_number, version) as source, open(destination, "wb") as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+    return destination
+
+@instrumented()
+def collect_document_garbage():
+    # Reclaims vault space no version needs: superseded current bodies that were
+    # stored as deltas, and deltas computed but never used
+    live = {row[0] for row in db_pool.connect().execute(
+        "SELECT content_hash FROM documents WHERE content_hash IS NOT NULL "
+        "UNION SELECT object_hash FROM document_versions")}
+    removed = document_vault.sweep(live)
+    logger.info("Removed %s unreferenced vault objects", removed, extra={"operation": "collect_document_garbage"})
+    return removed
+
+# === Document Search ===
+# Non-PDF bodies up to this size are indexed as-is when they decode as UTF-8
+MAX_TEXT_BYTES = 16 * 1024 * 1024
+
+SearchHit = namedtuple("SearchHit", "document_number version rank snippet")
+
+def extract_document_text(vault_root, content_hash):
+    # Runs in a worker process: opens the blob itself rather than receiving its bytes.
+    # Returns (status, text, error) instead of raising, so one corrupt PDF does not
+    # abort the batch.
+    try:
+        with DocumentVault(vault_root).open(content_hash) as f:
+            if f.peek(5)[:5] == b"%PDF-":
+                if PyPDF2 is None:
+                    return "skipped", None, "PyPDF2 is not installed"
+                reader = PyPDF2.PdfReader(f)
+                return "indexed", "\n".join(page.extract_text() or "" for page in reader.pages), None
+            data = f.read(MAX_TEXT_BYTES + 1)
+        if len(data) > MAX_TEXT_BYTES:
+            return "skipped", None, "not a PDF and too large to index as text"
+        return "indexed", data.decode("utf-8"), None
+    except UnicodeDecodeError:
+        return "skipped", None, "not a PDF or UTF-8 text"
     except Exception as e:
-        logging.error(f"Update State Error: {e}")
+        return "failed", None, f"{type(e).__name__}: {e}"
+
+def pending_documents(conn, limit=None):
+    query = '''
+        SELECT d.document_number, d.version, d.content_hash FROM documents d
+        LEFT JOIN document_text_index i ON i.document_number = d.document_number AND i.version IS d.version
+        WHERE d.content_hash IS NOT NULL AND i.id IS NULL
+    '''
+    if limit:
+        return conn.execute(query + " LIMIT ?", (limit,)).fetchall()
+    return conn.execute(query).fetchall()
+
+@instrumented(rows=lambda result: sum(result.values()))
+def index_documents(workers=None, batch_size=200):
+    # Extracts text for every document version not yet indexed, in a process pool
+    # (PDF parsing is CPU-bound), and writes each batch in one transaction. Bodies
+    # shared by several documents are extracted once.
+    stats = {"indexed": 0, "skipped": 0, "failed": 0}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            pending = pending_documents(db_pool.connect(), batch_size)
+            if not pending:
+                break
+            hashes = list(dict.fromkeys(row["content_hash"] for row in pending))
+            extracted = dict(zip(hashes, pool.map(extract_document_text, [document_vault.root] * len(hashes), hashes)))
+            with db_pool.transaction() as conn:
+                for row in pending:
+                    status, text, error = extracted[row["content_hash"]]
+                    cursor = conn.execute(f"INSERT INTO document_text_index (document_number, version, content_hash, "
+                                          f"status, error, indexed_at) VALUES (?, ?, ?, ?, ?, {NOW_SQL})",
+                                          (row["document_number"], row["version"], row["content_hash"], status, error))
+                    if text is not None:
+                        conn.execute("INSERT INTO document_text (rowid, body) VALUES (?, ?)", (cursor.lastrowid, text))
+                    stats[status] += 1
+                    if error:
+                        logger.warning("Document %s v%s not indexed: %s", row["document_number"], row["version"], error,
+                                       extra={"operation": "index_documents"})
+    logger.info("Indexed documents: %s", stats, extra={"operation": "index_documents", "rows": sum(stats.values())})
+    return stats
+
+@instrumented()
+def reset_document_index(status=None):
+    # Forgets indexed versions (all, or only those with `status`, e.g. "skipped"
+    # after installing PyPDF2) so the next index_documents() extracts them again
+    with db_pool.transaction() as conn:
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        conn.execute(f"DELETE FROM document_text WHERE rowid IN (SELECT id FROM document_text_index {where})", params)
+        removed = conn.execute(f"DELETE FROM document_text_index {where}", params).rowcount
+    return removed
+
+def run_document_indexer(interval=5.0, stop=None, workers=None):
+    # Background loop for a thread or service: indexes new versions as they are stored
+    for _ in watch_database(interval, stop):
+        if pending_documents(db_pool.connect(), 1):
+            index_documents(workers)
+
+def match_expression(text):
+    # Plain words as an FTS5 query: every term must appear, in any order. Terms are
+    # quoted, so part numbers like P-0042 are not read as query operators.
+    terms = text.split()
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+@instrumented(rows=len)
+def search_documents(text, limit=20, all_versions=False, raw=False):
+    # Ranked by bm25 (best first). By default only each document's current version
+    # is searched; raw=True passes `text` through as FTS5 query syntax.
+    query = text if raw else match_expression(text)
+    if not query:
+        return []
+    current = "" if all_versions else \
+        "JOIN documents d ON d.document_number = i.document_number AND d.version IS i.version"
+    rows = db_pool.connect().execute(f'''
+        SELECT i.document_number, i.version, bm25(document_text) AS rank,
+               snippet(document_text, 0, '[', ']', '...', 16) AS snippet
+        FROM document_text JOIN document_text_index i ON i.id = document_text.rowid {current}
+        WHERE document_text MATCH ?
+        ORDER BY rank LIMIT ?
+    ''', (query, limit))
+    return [SearchHit(*row) for row in rows]
+
+# === Item Documents ===
+ItemDocument = namedtuple("ItemDocument", "item_number document_number role version file_path content_hash size")
+
+document_links_cache = TTLCache(maxsize=2048, ttl=3600.0)
+
+@instrumented()
+def link_document(item_number, document_number, role=None):
+    # Re-linking an existing pair replaces its role
+    with db_pool.transaction() as conn:
+        conn.execute("INSERT INTO item_documents (item_number, document_number, role) VALUES (?, ?, ?) "
+                     "ON CONFLICT (item_number, document_number) DO UPDATE SET role = excluded.role",
+                     (item_number, document_number, role))
+
+@instrumented()
+def unlink_document(item_number, document_number):
+    with db_pool.transaction() as conn:
+        return conn.execute("DELETE FROM item_documents WHERE item_number = ? AND document_number = ?",
+                            (item_number, document_number)).rowcount > 0
+
+def get_document_version(conn=None):
+    row = (conn or db_pool.connect()).execute("SELECT value FROM sequences WHERE name = 'document_version'").fetchone()
+    return row[0] if row else 0
+
+@instrumented(rows=len)
+def get_item_documents(item_number, subtree=False, role=None):
+    # Documents linked to the item, or with subtree=True to the item and everything
+    # below it (one query over bom_closure), with each document's current version.
+    # Results are cached per (item, subtree, role) and keyed on bom_version and
+    # document_version, so any link, BOM or document change retires them.
+    conn = db_pool.connect()
+    key = (db_pool.db_path, item_number, subtree, role, get_bom_version(conn), get_document_version(conn))
+    documents = document_links_cache.get(key)
+    if documents is TTLCache.MISSING:
+        scope = "SELECT :item UNION ALL SELECT descendant FROM bom_closure WHERE ancestor = :item" if subtree else "SELECT :item"
+        rows = conn.execute(f'''
+            SELECT l.item_number, l.document_number, l.role, d.version, d.file_path, d.content_hash, d.size
+            FROM item_documents l LEFT JOIN documents d ON d.document_number = l.document_number
+            WHERE l.item_number IN ({scope}) AND (:role IS NULL OR l.role = :role)
+            ORDER BY l.item_number, l.document_number
+        ''', {"item": item_number, "role": role})
+        documents = tuple(ItemDocument(*row) for row in rows)
+        document_links_cache.put(key, documents)
+    return list(documents)
+
+@instrumented(rows=len)
+def get_document_items(document_number):
+    rows = db_pool.connect().execute("SELECT item_number FROM item_documents WHERE document_number = ? ORDER BY item_number",
+                                     (document_number,))
+    return [row[0] for row in rows]
+
+# === Change Records ===
+CHANGE_RECORD_FIELDS = ("title", "description", "impact", "status", "phase", "created_by", "created_at")
+
+def change_record(row):
+    record = dict(row)
+    record["actions"] = json.loads(record["actions"])
+    return record
+
+@instrumented()
+def create_change_record(title, description, impact, created_by, created_at=None, status="Open", phase="Issue"):
+    change_id = f"CHG-{allocate_numbers('change_record')[0]}"
+    with db_pool.transaction() as conn:
+        conn.execute(f'''
+            INSERT INTO change_records (id, title, description, impact, status, phase, created_by, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, {NOW_SQL}), {NOW_SQL})
+        ''', (change_id, title, description, impact, status, phase, created_by, created_at))
+    logger.info("Created change record %s", change_id, extra={"operation": "create_change_record", "rows": 1})
+    return get_change_record(change_id)
+
+@instrumented()
+def update_change_record(change_id, expected_phase=None, expected_status=None, **fields):
+    # Writes only the given fields of one record. With expected_phase and/or
+    # expected_status the update only applies while the record is still in that
+    # phase/status, so a stale or concurrent session cannot repeat or undo a
+    # transition; returns whether a row changed.
+    unknown = set(fields) - set(CHANGE_RECORD_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown change record fields: {', '.join(sorted(unknown))}")
+    if not fields:
         return False
+    assignments = ", ".join(f"{name} = :{name}" for name in fields)
+    guard = "".join(f" AND {column} = :expected_{column}" for column, value
+                    in (("phase", expected_phase), ("status", expected_status)) if value is not None)
+    with db_pool.transaction() as conn:
+        updated = conn.execute(f"UPDATE change_records SET {assignments}, updated_at = {NOW_SQL} WHERE id = :id{guard}",
+                               dict(fields, id=change_id, expected_phase=expected_phase,
+                                    expected_status=expected_status)).rowcount
+    logger.info("Updated change record %s: %s", change_id, fields,
+                extra={"operation": "update_change_record", "rows": updated})
+    return updated > 0
+
+@instrumented()
+def add_change_record_action(change_id, action):
+    with db_pool.transaction() as conn:
+        return conn.execute(f"UPDATE change_records SET actions = json_insert(actions, '$[#]', ?), "
+                            f"updated_at = {NOW_SQL} WHERE id = ?", (action, change_id)).rowcount > 0
+
+@instrumented()
+def get_change_record(change_id):
+    row = db_pool.connect().execute("SELECT * FROM change_records WHERE id = ?", (change_id,)).fetchone()
+    return change_record(row) if row else None
+
+@instrumented(rows=len)
+def list_change_records(phase=None, status=None, created_by=None):
+    filters = {"phase": phase, "status": status, "created_by": created_by}
+    where = " AND ".join(f"{name} = :{name}" for name, value in filters.items() if value is not None)
+    rows = db_pool.connect().execute("SELECT * FROM change_records" + (f" WHERE {where}" if where else "") +
+                                     " ORDER BY CAST(SUBSTR(id, 5) AS INTEGER), id", filters)
+    return [change_record(row) for row in rows]
+
+@instrumented(rows=lambda result: result)
+def import_change_data(path):
+    # One-time move of a change_data.json file into change_records. Records already
+    # present are left alone, so an interrupted import can simply be re-run; the file
+    # is renamed to <path>.migrated afterwards so it is not picked up again.
+    try:
+        with open(path) as f:
+            changes = json.load(f).get("changes", {})
+    except FileNotFoundError:
+        # Another session got there first and has already renamed it
+        return 0
+    skipped = []
+    with db_pool.transaction() as conn:
+        for change_id, change in changes.items():
+            inserted = conn.execute(f'''
+                INSERT OR IGNORE INTO change_records (id, title, description, impact, status, phase,
+                                                      created_by, created_at, updated_at, actions)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, {NOW_SQL}, ?)
+            ''', (change.get("id", change_id), change.get("title") or change_id, change.get("description"),
+                  change.get("impact"), change.get("status", "Open"), change.get("phase", "Issue"),
+                  change.get("created_by"), change.get("created_at"), json.dumps(change.get("actions", [])))).rowcount
+            if not inserted:
+                skipped.append(change.get("id", change_id))
+        # Move the numbering past the imported ids if it was already in use
+        seed_query, floor = SEQUENCES["change_record"]
+        conn.execute("UPDATE sequences SET value = MAX(value, COALESCE((" + seed_query + "), ?)) WHERE name = 'change_record'",
+                     (floor,))
+    try:
+        os.replace(path, path + ".migrated")
+    except FileNotFoundError:
+        # A concurrent import of the same file won; its rows are the ones kept
+        return 0
+    imported = len(changes) - len(skipped)
+    if skipped:
+        logger.warning("Kept existing change records over %s entries of %s: %s", len(skipped), path, ", ".join(skipped),
+                       extra={"operation": "import_change_data"})
+    logger.info("Imported %s change records from %s", imported, path, extra={"operation": "import_change_data", "rows": imported})
+    return imported
+
+# === Bulk Import ===
+def read_bom_csv(path):
+    with open(path, newline="") as f:
+        yield from csv.DictReader(f)
+
+def read_bom_json(path):
+    # .jsonl/.ndjson files are streamed line by line; .json must hold a list of rows
+    with open(path) as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+def read_bom_file(path):
+    return read_bom_csv(path) if path.lower().endswith(".csv") else read_bom_json(path)
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def existing_item_numbers(conn, keys, batch_size=900):
+    keys = list(keys)
+    found = set()
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i:i + batch_size]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(f"SELECT item_number FROM items WHERE item_number IN ({placeholders})", batch)
+        found.update(row[0] for row in rows)
+    return found
+
+def parse_bom_row(row):
+    # A blank CSV cell or missing key means 1; an explicit 0 stays 0
+    quantity = row.get("quantity")
+    return (str(row["parent_item"]).strip(), str(row["child_item"]).strip(),
+            int(quantity) if quantity not in (None, "") else 1)
+
+def find_bom_cycle(links):
+    # Iterative three-colour DFS over (parent, child, ...) tuples: O(nodes + links).
+    # Returns one cycle as a list of identifiers (first == last), or None.
+    children = {}
+    for link in links:
+        children.setdefault(link[0], []).append(link[1])
+    state = {}  # 1 = on the current DFS path, 2 = finished
+    for start in children:
+        if start in state:
+            continue
+        path = [start]
+        stack = [iter(children.get(start, ()))]
+        state[start] = 1
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                state[path.pop()] = 2
+                stack.pop()
+            elif state.get(child) == 1:
+                return path[path.index(child):] + [child]
+            elif child not in state:
+                state[child] = 1
+                path.append(child)
+                stack.append(iter(children.get(child, ())))
+    return None
+
+def validate_bom_rows(links):
+    # Identifiers that are existing items bring their current reachability
+    # from bom_closure, so cycles closed through stored links are caught too.
+    conn = db_pool.connect()
+    keys = {key for link in links for key in link[:2]}
+    existing = existing_item_numbers(conn, keys)
+    edges = list(links)
+    existing_list = list(existing)
+    for i in range(0, len(existing_list), 900):
+        batch = existing_list[i:i + 900]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(f"SELECT ancestor, descendant FROM bom_closure WHERE ancestor IN ({placeholders})", batch)
+        edges.extend((a, d) for a, d in rows if d in existing)
+    cycle = find_bom_cycle(edges)
+    if cycle:
+        raise BOMCycleError(f"Imported BOM contains a cycle: {' -> '.join(cycle)}")
+
+@instrumented(rows=lambda result: result["rows"])
+def import_bom(rows, chunk_size=5000, validate=False):
+    # rows: dicts with parent_item, child_item and optional quantity. Identifiers that are
+    # already item numbers are linked as-is; any other identifier is treated as a source key
+    # and gets a newly allocated item number. Returns stats plus the key -> item_number map.
+    # validate=True reads all rows up front and rejects a cyclic BOM before writing anything;
+    # otherwise the cycle trigger still aborts the offending chunk.
+    start = time.perf_counter()
+    links = (parse_bom_row(row) for row in rows)
+    if validate:
+        links = list(links)
+        validate_bom_rows(links)
+    item_numbers = {}
+    total_rows = 0
+    items_created = 0
+    for chunk in chunked(links, chunk_size):
+        with db_pool.transaction() as conn:
+            upper_levels = {}
+            for parent, child, _ in chunk:
+                upper_levels.setdefault(parent, None)
+                upper_levels.setdefault(child, parent)
+            unknown = [key for key in upper_levels if key not in item_numbers]
+            for key in existing_item_numbers(conn, unknown):
+                item_numbers[key] = key
+            new_keys = [key for key in unknown if key not in item_numbers]
+            if new_keys:
+                for key, number in zip(new_keys, allocate_numbers("item", len(new_keys))):
+                    item_numbers[key] = format_item_number(number)
+                conn.executemany("INSERT INTO items (item_number, revision, upper_level, state) VALUES (?, 'A', ?, 'Draft')",
+                                 [(item_numbers[key], item_numbers.get(upper_levels[key])) for key in new_keys])
+            try:
+                conn.executemany(UPSERT_BOM_LINK, [(item_numbers[p], item_numbers[c], q) for p, c, q in chunk])
+            except sqlite3.IntegrityError as e:
+                if BOM_CYCLE_MESSAGE in str(e):
+                    raise BOMCycleError(f"Import aborted after {total_rows} rows: {e}") from e
+                raise
+        total_rows += len(chunk)
+        items_created += len(new_keys)
+    elapsed = time.perf_counter() - start
+    stats = {
+        "rows": total_rows,
+        "items_created": items_created,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(total_rows / elapsed, 1) if elapsed else None,
+        "item_numbers": item_numbers,
+    }
+    logger.info("Imported %s BOM rows (%s new items) at %s rows/s", total_rows, items_created, stats["rows_per_sec"],
+                extra={"operation": "import_bom", "duration_ms": round(elapsed * 1000, 3), "rows": total_rows})
+    return stats
+
+def import_bom_file(path, chunk_size=5000, validate=False):
+    return import_bom(read_bom_file(path), chunk_size, validate)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pyPLM
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # Points pyPLM at a fresh file; connections are closed even if the test fails
+    path = str(tmp_path / "plm.db")
+    pyPLM.use_database(path)
+    try:
+        yield path
+    finally:
+        pyPLM.close_db_connections()
+
+
+@pytest.fixture
+def plm_db(db_path):
+    pyPLM.create_database()
+    return db_path
@@ -0,0 +1,32 @@
+import time
+
+import pyPLM
+
+
+def scratch_hash(root):
+    with pyPLM.db_pool.transaction() as conn:
+        return pyPLM.BaselineBuilder(conn, root).hash_item(root)
+
+
+def test_incremental_baselines_match_a_full_rehash(plm_db):
+    rows = [{"parent_item": parent, "child_item": child, "quantity": 1}
+            for parent, child in [("A", "B"), ("A", "C"), ("B", "D"), ("B", "E"), ("C", "F"), ("F", "G")]]
+    n = pyPLM.import_bom(rows)["item_numbers"]
+    first = pyPLM.create_baseline("BL-0", n["A"])
+    assert first["root_hash"] == scratch_hash(n["A"])
+    edits = [
+        lambda conn: pyPLM.revise_item(n["D"]),
+        lambda conn: conn.execute(pyPLM.UPSERT_BOM_LINK, (n["C"], n["F"], 3)),
+        lambda conn: conn.execute("DELETE FROM bom_links WHERE parent_item = ? AND child_item = ?", (n["B"], n["E"])),
+        lambda conn: conn.execute(pyPLM.UPSERT_BOM_LINK, (n["B"], n["G"], 2)),
+        lambda conn: pyPLM.revise_item(n["G"]),
+    ]
+    for i, edit in enumerate(edits, 1):
+        # Baseline windows are compared at millisecond resolution
+        time.sleep(0.01)
+        with pyPLM.db_pool.transaction() as conn:
+            edit(conn)
+        time.sleep(0.01)
+        result = pyPLM.create_baseline(f"BL-{i}", n["A"])
+        assert result["root_hash"] == scratch_hash(n["A"]), i
+        assert result["nodes_reused"] > 0
@@ -0,0 +1,99 @@
+import random
+import time
+
+import pytest
+
+import pyPLM
+
+
+def closure_from_links(conn):
+    children = {}
+    for parent, child in conn.execute("SELECT parent_item, child_item FROM bom_links"):
+        children.setdefault(parent, set()).add(child)
+    pairs = set()
+    for root in children:
+        stack = list(children[root])
+        seen = set()
+        while stack:
+            item = stack.pop()
+            if item not in seen:
+                seen.add(item)
+                stack.extend(children.get(item, ()))
+        pairs.update((root, item) for item in seen)
+    return pairs
+
+
+def test_delete_unlinks_ancestors(plm_db):
+    pyPLM.add_bom_link_to_db("P0001", "P0002", 1)
+    with pyPLM.db_pool.transaction() as conn:
+        conn.execute("DELETE FROM bom_links")
+    assert pyPLM.get_ancestor_items("P0002") == set()
+    pyPLM.add_bom_link_to_db("P0002", "P0001", 1)
+    assert pyPLM.get_ancestor_items("P0001") == {"P0002"}
+
+
+def test_update_rejects_cycles(plm_db):
+    pyPLM.add_bom_link_to_db("A", "B", 1)
+    pyPLM.add_bom_link_to_db("B", "C", 1)
+    with pytest.raises(Exception, match=pyPLM.BOM_CYCLE_MESSAGE):
+        with pyPLM.db_pool.transaction() as conn:
+            conn.execute("UPDATE bom_links SET child_item = 'A' WHERE parent_item = 'B'")
+
+
+def test_closure_matches_links_after_random_edits(plm_db):
+    rng = random.Random(1)
+    items = [f"I{i:02d}" for i in range(30)]
+    conn = pyPLM.get_db_connection()
+    for step in range(300):
+        # Links only point from lower to higher index, so the graph stays a DAG
+        a, b = sorted(rng.sample(range(len(items)), 2))
+        action = rng.random()
+        with pyPLM.db_pool.transaction() as conn:
+            if action < 0.6:
+                conn.execute(pyPLM.UPSERT_BOM_LINK, (items[a], items[b], 1))
+            elif action < 0.85:
+                conn.execute("DELETE FROM bom_links WHERE parent_item = ?", (items[a],))
+            else:
+                row = conn.execute("SELECT parent_item, child_item FROM bom_links ORDER BY random() LIMIT 1").fetchone()
+                exists = conn.execute("SELECT 1 FROM bom_links WHERE parent_item = ? AND child_item = ?",
+                                      (items[a], items[b])).fetchone()
+                if row and not exists:
+                    conn.execute("UPDATE bom_links SET parent_item = ?, child_item = ? WHERE parent_item = ? AND child_item = ?",
+                                 (items[a], items[b], row[0], row[1]))
+        assert set(map(tuple, conn.execute("SELECT ancestor, descendant FROM bom_closure"))) == closure_from_links(conn)
+
+
+def test_delete_only_rebuilds_affected_pairs(plm_db):
+    links, level = [], ["R"]
+    for _ in range(4):
+        level = [f"{parent}.{i}" for parent in level for i in range(10)]
+        links.extend((item.rsplit(".", 1)[0], item, 1) for item in level)
+    with pyPLM.db_pool.transaction() as conn:
+        conn.executemany(pyPLM.UPSERT_BOM_LINK, links)
+    start = time.perf_counter()
+    pyPLM.rebuild_bom_closure()
+    rebuild = time.perf_counter() - start
+    for statement in ("DELETE FROM bom_links WHERE parent_item = 'R.0.0.0' AND child_item = 'R.0.0.0.0'",
+                      "DELETE FROM bom_links WHERE parent_item = 'R.1'",
+                      "UPDATE bom_links SET parent_item = 'R.2.3' WHERE child_item = 'R.3.0'"):
+        start = time.perf_counter()
+        with pyPLM.db_pool.transaction() as conn:
+            conn.execute(statement)
+        assert time.perf_counter() - start < rebuild / 4, statement
+    conn = pyPLM.get_db_connection()
+    assert set(map(tuple, conn.execute("SELECT ancestor, descendant FROM bom_closure"))) == closure_from_links(conn)
+
+
+def test_duplicate_links_are_kept_on_upgrade(db_path):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    pyPLM.create_tables(conn)
+    conn.executemany("INSERT INTO bom_links VALUES (?, ?, ?)",
+                     [("P0001", "P0002", 1), ("P0001", "P0002", 3), ("P0001", "P0003", 2)])
+    conn.commit()
+    conn.close()
+    pyPLM.create_database()
+    conn = pyPLM.get_db_connection()
+    rows = conn.execute("SELECT parent_item, child_item, quantity FROM bom_links_duplicates").fetchall()
+    assert [tuple(row) for row in rows] == [("P0001", "P0002", 1)]
+    assert pyPLM.get_bom_as_of("P0001", "9000-01-01") == {"P0002": 3, "P0003": 2}
@@ -0,0 +1,29 @@
+import time
+
+import pyPLM
+
+
+def now(conn):
+    # History timestamps have millisecond resolution; keep checkpoints apart
+    time.sleep(0.01)
+    stamp = conn.execute(f"SELECT {pyPLM.NOW_SQL}").fetchone()[0]
+    time.sleep(0.01)
+    return stamp
+
+
+def test_diff_as_of_sees_changes_under_links_removed_since(plm_db):
+    with pyPLM.db_pool.transaction() as conn:
+        conn.executemany("INSERT INTO items (item_number, revision, state) VALUES (?, 'A', 'Draft')",
+                         [("A",), ("B",), ("C",)])
+        conn.executemany(pyPLM.UPSERT_BOM_LINK, [("A", "B", 1), ("B", "C", 2)])
+    conn = pyPLM.get_db_connection()
+    t0 = now(conn)
+    pyPLM.revise_item("C")
+    t1 = now(conn)
+    with pyPLM.db_pool.transaction() as conn:
+        conn.execute("DELETE FROM bom_links WHERE parent_item = 'B' AND child_item = 'C'")
+    lines = pyPLM.diff_as_of("A", t0, t1)
+    assert [(line.change, line.item_number, line.old_revision, line.new_revision) for line in lines] == \
+        [("revision", "C", "A", "B")]
+    removed = pyPLM.diff_as_of("A", t1)
+    assert [(line.change, line.item_number) for line in removed] == [("removed", "C")]
@@ -0,0 +1,22 @@
+import io
+import sqlite3
+
+import pyPLM
+
+
+def test_document_and_change_record_writes_are_logged_and_replayed(plm_db, tmp_path):
+    pyPLM.store_document("DRW-1", io.BytesIO(b"rev a\n"), "drw1.txt")
+    pyPLM.store_document("DRW-1", io.BytesIO(b"rev b\n"))
+    pyPLM.link_document("P0001", "DRW-1", "Drawing")
+    change_id = pyPLM.create_change_record("Seal leak", "", "High", created_by="me")["id"]
+    pyPLM.update_change_record(change_id, status="Pending")
+    tables = {event.table_name for event in pyPLM.read_events()}
+    assert {"documents", "document_versions", "item_documents", "change_records"} <= tables
+
+    target = str(tmp_path / "replay.db")
+    counts = pyPLM.replay_events(target)
+    assert counts["document_versions"] == 2 and counts["item_documents"] == 1
+    conn = sqlite3.connect(target)
+    assert conn.execute("SELECT version, file_path FROM documents").fetchall() == [(2, "drw1.txt")]
+    assert conn.execute("SELECT status FROM change_records").fetchall() == [("Pending",)]
+    conn.close()
@@ -0,0 +1,24 @@
+import json
+
+import pyPLM
+
+
+def test_stale_transition_does_not_move_a_record_back(plm_db):
+    change_id = pyPLM.create_change_record("Seal leak", "", "High", created_by="me")["id"]
+    assert pyPLM.update_change_record(change_id, expected_phase="Issue", expected_status="Open", phase="CR", status="Pending")
+    assert pyPLM.update_change_record(change_id, expected_phase="CR", expected_status="Pending", phase="CO", status="Open")
+    # A session still showing Issue/Open clicks "Analyze Impact"
+    assert not pyPLM.update_change_record(change_id, expected_phase="Issue", expected_status="Open",
+                                          phase="CR", status="Pending")
+    record = pyPLM.get_change_record(change_id)
+    assert (record["phase"], record["status"]) == ("CO", "Open")
+
+
+def test_import_of_an_already_moved_file(plm_db, tmp_path):
+    path = str(tmp_path / "change_data.json")
+    with open(path, "w") as f:
+        json.dump({"changes": {"CHG-3": {"id": "CHG-3", "title": "Old", "actions": ["a"]}}}, f)
+    assert pyPLM.import_change_data(path) == 1
+    assert pyPLM.import_change_data(path) == 0
+    assert pyPLM.get_change_record("CHG-3")["actions"] == ["a"]
+    assert pyPLM.create_change_record("Next", "", "Low", created_by="me")["id"] == "CHG-4"
@@ -0,0 +1,61 @@
+import random
+
+import pyPLM
+
+
+def random_links(rng, items, count):
+    links = {}
+    while len(links) < count:
+        a, b = sorted(rng.sample(range(len(items)), 2))
+        links[items[a], items[b]] = rng.randint(1, 9)
+    return links
+
+
+def assert_matches(graph, links):
+    children, parents = {}, {}
+    for (parent, child), qty in links.items():
+        children.setdefault(parent, {})[child] = qty
+        parents.setdefault(child, set()).add(parent)
+    for item_number in graph.ids:
+        node = graph.get_item(item_number)
+        assert {c.item_number: qty for c, qty in node.children()} == children.get(item_number, {})
+        assert {p.item_number for p in node.parents()} == parents.get(item_number, set())
+    assert graph.link_count() == len(links)
+
+
+def test_csr_build_matches_links():
+    rng = random.Random(0)
+    items = [f"P{i:04d}" for i in range(200)]
+    links = random_links(rng, items, 1500)
+    # Shuffled input exercises the counting sort rather than already-grouped rows
+    rows = [(parent, child, qty) for (parent, child), qty in links.items()]
+    rng.shuffle(rows)
+    graph = pyPLM.CompactBOMGraph.from_links(rows)
+    assert not graph.extra
+    offsets = graph.child_offsets
+    assert offsets[0] == 0 and offsets[-1] == len(rows)
+    assert all(offsets[i] <= offsets[i + 1] for i in range(len(offsets) - 1))
+    assert_matches(graph, links)
+
+
+def test_overflow_links_survive_compact():
+    rng = random.Random(1)
+    items = [f"P{i:04d}" for i in range(100)]
+    links = random_links(rng, items, 400)
+    graph = pyPLM.CompactBOMGraph.from_links((p, c, q) for (p, c), q in links.items())
+    # New links, including ones to items the build never saw, go to the overflow
+    for parent, child in [("P0000", "NEW1"), ("NEW1", "NEW2"), ("P0050", "NEW2")]:
+        graph.add_link(parent, child, 4)
+        links[parent, child] = 4
+    # Re-adding a built link or changing a quantity updates in place
+    built = next(iter(links))
+    graph.add_link(*built, 7)
+    links[built] = 7
+    graph.change_quantity("NEW1", "NEW2", 5)
+    links["NEW1", "NEW2"] = 5
+    assert set(graph.extra) == {graph.position["P0000"], graph.position["NEW1"], graph.position["P0050"]}
+    assert_matches(graph, links)
+    graph.compact()
+    assert not graph.extra
+    assert_matches(graph, links)
+    assert graph.get_item("NEW1").get_item("NEW2") is not None
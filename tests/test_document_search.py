@@ -0,0 +1,21 @@
+import io
+
+import pyPLM
+
+
+def test_search_only_matches_current_versions(plm_db):
+    pyPLM.store_document("SPEC-1", io.BytesIO(b"Bracket P-0042 torque 12 Nm\n"), "spec.txt")
+    pyPLM.store_document("SPEC-2", io.BytesIO(b"Seal leak test procedure\n"), "seal.txt")
+    pyPLM.store_document("IMG-1", io.BytesIO(b"\xff\xd8\xff\xe0 not text"), "photo.jpg")
+    assert pyPLM.index_documents(workers=1) == {"indexed": 2, "skipped": 1, "failed": 0}
+    pyPLM.store_document("SPEC-1", io.BytesIO(b"Bracket P-0042 torque 14 Nm\n"))
+    assert pyPLM.index_documents(workers=1) == {"indexed": 1, "skipped": 0, "failed": 0}
+    assert pyPLM.index_documents(workers=1) == {"indexed": 0, "skipped": 0, "failed": 0}
+
+    hits = pyPLM.search_documents("torque P-0042")
+    assert [(hit.document_number, hit.version) for hit in hits] == [("SPEC-1", 2)]
+    assert "[torque]" in hits[0].snippet
+    assert pyPLM.search_documents("12") == []
+    assert {(hit.document_number, hit.version) for hit in pyPLM.search_documents("torque", all_versions=True)} == \
+        {("SPEC-1", 1), ("SPEC-1", 2)}
+    assert [hit.document_number for hit in pyPLM.search_documents("leak")] == ["SPEC-2"]
@@ -0,0 +1,51 @@
+import io
+import os
+import random
+import time
+
+import pyPLM
+
+
+def test_delta_round_trip_with_edits():
+    rng = random.Random(0)
+    base = "".join(f"{i:05d} clause {rng.randint(0, 99)}\n" for i in range(5000)).encode()
+    lines = base.splitlines(keepends=True)
+    for _ in range(50):
+        lines[rng.randrange(len(lines))] = b"edited\n"
+    lines.insert(100, b"inserted\n")
+    del lines[2000:2010]
+    target = b"".join(lines)
+    delta = pyPLM.make_delta(base, target)
+    assert pyPLM.apply_delta(base, delta) == target
+    assert len(delta) < len(target) // 10
+
+
+def test_delta_on_repeated_lines_is_fast():
+    # Repeated lines were quadratic for a SequenceMatcher-based delta
+    base = b"0,0,0,0,0,0,0,0\n" * 11000
+    target = base[:80000] + b"1,1,1,1,1,1,1,1\n" + base[80000:] + b"2\n" * 500
+    start = time.perf_counter()
+    delta = pyPLM.make_delta(base, target)
+    assert time.perf_counter() - start < 2.0
+    assert pyPLM.apply_delta(base, delta) == target
+
+
+def test_delta_without_newlines():
+    base = os.urandom(4096)
+    target = base[:2000] + b"x" + base[2000:]
+    assert pyPLM.apply_delta(base, pyPLM.make_delta(base, target)) == target
+
+
+def test_store_and_read_versions(plm_db):
+    bodies = []
+    body = [b"row %d\n" % i for i in range(2000)]
+    for revision in range(pyPLM.KEYFRAME_INTERVAL + 10):
+        body[revision] = b"revised %d\n" % revision
+        bodies.append(b"".join(body) + b"same\n" * 3000)
+        pyPLM.store_document("DOC-1", io.BytesIO(bodies[-1]))
+    versions = pyPLM.list_document_versions("DOC-1")
+    assert max(v["chain"] for v in versions) < pyPLM.KEYFRAME_INTERVAL
+    assert any(v["kind"] == "delta" for v in versions)
+    for version, expected in enumerate(bodies, 1):
+        with pyPLM.open_document("DOC-1", version) as f:
+            assert f.read() == expected
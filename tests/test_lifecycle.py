@@ -0,0 +1,27 @@
+import pyPLM
+
+
+def make_product():
+    rows = [{"parent_item": "A", "child_item": "B", "quantity": 1},
+            {"parent_item": "B", "child_item": "C", "quantity": 1},
+            {"parent_item": "A", "child_item": "D", "quantity": 1}]
+    return pyPLM.import_bom(rows)["item_numbers"]
+
+
+def test_rejected_child_blocks_its_ancestors(plm_db):
+    n = make_product()
+    pyPLM.transition_items([n["A"], n["B"], n["D"]], "In Review")
+    result = pyPLM.transition_items([n["A"]], "Released", include_bom=True, atomic=False)
+    ok = {r.item_number: r.ok for r in result["results"]}
+    assert ok == {n["A"]: False, n["B"]: False, n["C"]: False, n["D"]: True}
+    states = pyPLM.get_item_states(list(n.values()))
+    assert states[n["A"]] == "In Review" and states[n["D"]] == "Released"
+
+
+def test_update_item_state_follows_the_lifecycle(plm_db):
+    n = make_product()
+    assert not pyPLM.update_item_state(n["C"], "Released")
+    assert pyPLM.update_item_state(n["C"], "In Review")
+    assert pyPLM.update_item_state(n["C"], "Released")
+    assert not pyPLM.update_item_state(n["C"], "Draft")
+    assert pyPLM.get_item_state(n["C"]) == "Released"
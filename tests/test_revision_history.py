@@ -0,0 +1,11 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pyPLM
+
+
+def test_as_of_timestamp_converts_aware_datetimes_to_utc():
+    plus_two = timezone(timedelta(hours=2))
+    assert pyPLM.as_of_timestamp(datetime(2025, 4, 1, 12, 0, tzinfo=plus_two)) == "2025-04-01T10:00:00.000"
+    assert pyPLM.as_of_timestamp(datetime(2025, 4, 1, 12, 0)) == "2025-04-01T12:00:00.000"
+    assert pyPLM.as_of_timestamp(date(2025, 4, 1)) == "2025-04-01T00:00:00.000"
+    assert pyPLM.as_of_timestamp("2025-04-01") == "2025-04-01"
@@ -0,0 +1,39 @@
+import gc
+import weakref
+
+import pyPLM
+
+
+def make_assembly():
+    top, sub, leaf = pyPLM.Item("A"), pyPLM.Item("B"), pyPLM.Item("C")
+    top.bom.add_item(sub, 2)
+    sub.bom.add_item(leaf, 3)
+    return top, sub
+
+
+def test_edits_invalidate_memoized_ancestors():
+    top, sub = make_assembly()
+    rollup = pyPLM.BOMRollup()
+    assert rollup.quantities(top) == {"C": 6}
+    sub.bom.change_quantity("C", 5)
+    assert rollup.quantities(top) == {"C": 10}
+
+
+def test_discarded_rollup_is_not_kept_alive():
+    top, sub = make_assembly()
+    rollup = pyPLM.BOMRollup()
+    rollup.quantities(top)
+    ref = weakref.ref(rollup)
+    del rollup
+    gc.collect()
+    assert ref() is None
+    sub.bom.change_quantity("C", 4)
+    assert sub.bom.listeners == []
+
+
+def test_close_detaches_listeners():
+    top, sub = make_assembly()
+    rollup = pyPLM.BOMRollup()
+    rollup.quantities(top)
+    rollup.close()
+    assert top.bom.listeners == [] and sub.bom.listeners == []